@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from agent.config import settings
+from agent.history import ConversationHistory
+from agent.metrics import request_trace
+from agent.schema_cache.cache import get_schema_snapshot
+from agent.utils.utility import now_iso_tz
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchProgress:
+    total: Optional[int] = None  # unknown while the input is still being read
+    done: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.done) / rate if self.total is not None and rate else None
+        return {
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "per_second": round(rate, 3),
+            "eta_seconds": round(remaining, 1) if remaining is not None else None,
+        }
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Questions from a JSONL file, one `{"question": ..., "id": ...}` (or bare string) per line, read lazily."""
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield {"id": None, "error": f"line {n}: invalid JSON ({e})"}
+                continue
+            yield item if isinstance(item, dict) else {"question": str(item)}
+
+
+async def _answer(graph, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    question = item.get("question")
+    out: Dict[str, Any] = {"index": index, "id": item.get("id"), "question": question}
+    if not isinstance(question, str) or not question.strip():
+        return {**out, "ok": False, "error": item.get("error") or "missing question"}
+    state = {
+        "user_query": question,
+        "now_iso": now_iso_tz(settings.app_timezone),
+        "timezone": settings.app_timezone,
+        "history": ConversationHistory(),  # batch questions are independent of each other
+    }
+    t0 = time.perf_counter()
+    try:
+        with request_trace("batch"):
+            final = await graph.ainvoke(state)
+    except Exception as e:
+        log.warning("batch question %s failed: %s", index, e)
+        return {**out, "ok": False, "error": str(e), "seconds": round(time.perf_counter() - t0, 3)}
+    return {
+        **out,
+        "ok": bool(final.get("validated_sql")),
+        "reply_text": final.get("reply_text") or "",
+        "final_sql": final.get("validated_sql"),
+        "rows": (final.get("result_rows") or [])[: settings.batch_max_rows],
+        "rowcount": final.get("rowcount", 0),
+        "error": final.get("error"),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+async def run_batch(items, graph, workers: Optional[int] = None, progress: Optional[BatchProgress] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Answer `items` (an iterable or async iterable of question dicts) with `workers` concurrent graph runs.
+
+    Results are yielded as they finish, each carrying its input `index`.
+    Input is pulled only as workers free up, so memory stays bounded by
+    the worker count however long the batch. All runs share the process
+    schema snapshot, prompt registry, LLM clients and connection pools.
+    """
+    workers = max(1, workers or settings.batch_workers)
+    progress = progress if progress is not None else BatchProgress()
+    # introspect once up front instead of every worker racing to do it
+    await asyncio.to_thread(get_schema_snapshot)
+
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=workers)
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=workers)
+    finished = object()
+
+    async def stop_workers():
+        for _ in range(workers):
+            await inbox.put(None)
+
+    async def feed():
+        try:
+            index = 0
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await inbox.put((index, item))
+                    index += 1
+            else:
+                for item in items:
+                    await inbox.put((index, item))
+                    index += 1
+            if progress.total is None:
+                progress.total = index
+        except asyncio.CancelledError:
+            # consumer gone: the workers are cancelled with us, nobody would drain the sentinels
+            raise
+        except BaseException:
+            await stop_workers()  # input error: let the workers finish what is queued
+            raise
+        await stop_workers()
+
+    async def work():
+        while (job := await inbox.get()) is not None:
+            await outbox.put(await _answer(graph, *job))
+
+    async def run_all():
+        # cancellation (consumer gone) propagates to every worker and skips the sentinel
+        results = await asyncio.gather(feed(), *(work() for _ in range(workers)), return_exceptions=True)
+        await outbox.put(finished)
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+
+    runner = asyncio.ensure_future(run_all())
+    try:
+        while (out := await outbox.get()) is not finished:
+            progress.done += 1
+            if not out["ok"]:
+                progress.failed += 1
+            yield out
+        await runner  # re-raise input errors
+    finally:
+        if not runner.done():
+            runner.cancel()
@@ -0,0 +1,12 @@
+from .ttl import TTLCache
+from .answer_cache import AnswerCache, answer_key, get_answer_cache
+from .result_cache import ResultCache, get_result_cache
+
+__all__ = [
+    "TTLCache",
+    "AnswerCache",
+    "answer_key",
+    "get_answer_cache",
+    "ResultCache",
+    "get_result_cache",
+]
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from agent.config import settings
+from agent.cache.ttl import TTLCache
+
+log = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+_EDGE_PUNCT = " \t\n\"'.?!;:"
+
+
+def normalize_question(text: str) -> str:
+    return _WS.sub(" ", (text or "").strip(_EDGE_PUNCT).lower())
+
+
+def answer_key(rephrased: str, schema_fingerprint: str, now_iso: str, timezone: str) -> str:
+    """Normalised question + schema fingerprint + local calendar date.
+
+    The date is part of the key because the rephrased question may still say
+    "this month" and the validated SQL may use now()/current_date.
+    """
+    parts = [normalize_question(rephrased), schema_fingerprint, (now_iso or "")[:10], timezone or ""]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+class _SqliteStore:
+    _SWEEP_EVERY = 100  # writes between expiry/size sweeps
+    _TOUCH_AFTER = 60.0  # seconds; a hit refreshes used_at only when it is older than this
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        # WAL: readers in other workers do not block on a writer; timeout waits out the rest
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache ("
+                " key TEXT PRIMARY KEY, sql TEXT NOT NULL, expires_at REAL, used_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql, expires_at, used_at FROM answer_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                with self._conn:
+                    self._conn.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+                return None
+            if row[2] + self._TOUCH_AFTER <= now:
+                with self._conn:
+                    self._conn.execute("UPDATE answer_cache SET used_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, sql: str, ttl: Optional[float], maxsize: int):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache (key, sql, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, sql, (now + ttl) if ttl else None, now),
+            )
+            self._writes += 1
+            if self._writes % self._SWEEP_EVERY == 0:
+                self._sweep(now, maxsize)
+
+    def _sweep(self, now: float, maxsize: int):
+        self._conn.execute("DELETE FROM answer_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM answer_cache WHERE key NOT IN "
+            "(SELECT key FROM answer_cache ORDER BY used_at DESC LIMIT ?)",
+            (maxsize,),
+        )
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+
+
+class AnswerCache:
+    """Maps a question (see answer_key) to SQL that already validated and ran.
+
+    An in-memory LRU/TTL tier sits in front of an optional SQLite file so hits
+    survive restarts and are shared between worker processes.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._mem = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._disk = _SqliteStore(path) if path else None
+        self._disk_hits = 0
+
+    def get(self, key: str) -> Optional[str]:
+        sql = self._mem.get(key)
+        if sql is None and self._disk is not None:
+            sql = self._disk_get(key)
+            if sql is not None:
+                self._disk_hits += 1
+                self._mem.put(key, sql)
+        return sql
+
+    def put(self, key: str, sql: str):
+        self._mem.put(key, sql)
+        if self._disk is not None:
+            self._disk_put(key, sql)
+
+    def invalidate(self, key: str):
+        self._mem.pop(key)
+        if self._disk is not None:
+            self._disk_delete(key)
+
+    # the event loop variants: the memory tier inline, the SQLite tier on a worker thread
+
+    async def aget(self, key: str) -> Optional[str]:
+        sql = self._mem.get(key)
+        if sql is None and self._disk is not None:
+            sql = await asyncio.to_thread(self._disk_get, key)
+            if sql is not None:
+                self._disk_hits += 1
+                self._mem.put(key, sql)
+        return sql
+
+    async def aput(self, key: str, sql: str):
+        self._mem.put(key, sql)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_put, key, sql)
+
+    async def ainvalidate(self, key: str):
+        self._mem.pop(key)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_delete, key)
+
+    # a broken or locked cache file costs a miss, never the request
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        try:
+            return self._disk.get(key)
+        except sqlite3.Error as e:
+            log.warning("answer cache read failed: %s", e)
+            return None
+
+    def _disk_put(self, key: str, sql: str):
+        try:
+            self._disk.put(key, sql, self.ttl, self.maxsize)
+        except sqlite3.Error as e:
+            log.warning("answer cache write failed: %s", e)
+
+    def _disk_delete(self, key: str):
+        try:
+            self._disk.delete(key)
+        except sqlite3.Error as e:
+            log.warning("answer cache delete failed: %s", e)
+
+    def stats(self) -> Dict[str, object]:
+        s = self._mem.stats()
+        # a memory miss that the disk answered is a hit overall
+        s["misses"] -= self._disk_hits
+        s["hits"] += self._disk_hits
+        s["disk_hits"] = self._disk_hits
+        s["persistent"] = self._disk is not None
+        return s
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide cache, or None when `answer_cache_enabled` is off."""
+    global _answer_cache
+    if not settings.answer_cache_enabled:
+        return None
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            maxsize=settings.answer_cache_size,
+            ttl=settings.answer_cache_ttl or None,
+            path=settings.answer_cache_path or None,
+        )
+    return _answer_cache
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+import orjson
+from agent.config import settings
+from agent.cache.ttl import TTLCache
+from agent.db.replicas import read_saw_writes_before
+from agent.types import ResultSet
+from agent.utils.utility import normalize_sql, referenced_tables
+
+log = logging.getLogger(__name__)
+
+MODCOUNT_SQL = """
+    SELECT relname, n_tup_ins + n_tup_upd + n_tup_del AS modcount
+    FROM pg_stat_user_tables
+    WHERE schemaname = %s
+"""
+
+
+class TableChangeTracker:
+    """Polls per-table modification counters from pg_stat_user_tables.
+
+    Runs in a daemon thread started on first use, so cache lookups compare
+    against the latest counters without opening a connection. Counters are
+    considered unknown once a poll is more than three intervals old.
+
+    Writers publish their counters with a delay (about 1s for busy backends,
+    up to 10s for one that goes idle right after writing), so a change can be
+    missed for that long; the TTL bounds everything else.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._counts: Dict[str, int] = {}
+        self._polled_at = 0.0
+        self._changed_at = 0.0  # poll that first saw the current counters
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _poll(self):
+        from agent.db.connection import get_conn
+
+        with get_conn(primary=True) as conn, conn.cursor() as cur:
+            cur.execute(MODCOUNT_SQL, (settings.db_schema,))
+            counts = {name: int(n) for name, n in cur.fetchall()}
+        now = time.monotonic()
+        if counts != self._counts:
+            # every write the new counters reflect was committed before now; set before the
+            # counters so a reader never pairs them with an older time
+            self._changed_at = now
+        self._polled_at = now
+        self._counts = counts
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+            except Exception as e:
+                log.warning("pg_stat_user_tables poll failed: %s", e)
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="table-change-tracker", daemon=True)
+                self._thread.start()
+
+    def last_change_at(self) -> float:
+        """Monotonic time of the poll that first saw the current counters."""
+        return self._changed_at
+
+    def fresh(self) -> bool:
+        return time.monotonic() - self._polled_at <= 3 * self.interval
+
+    def versions(self, tables: Iterable[str]) -> Optional[Tuple[Tuple[str, int], ...]]:
+        """Counters for `tables`, or None if unknown (stale poll)."""
+        if not self.fresh():
+            return None
+        counts = self._counts
+        # views and other relations without stats only get the TTL
+        return tuple(sorted((t, counts[t]) for t in tables if t in counts))
+
+
+class ResultCache:
+    """Bounded cache of executed SELECT results keyed by normalised SQL.
+
+    An entry is served only while the modification counters of every table it
+    references are unchanged (and within the TTL). Memory is capped by the
+    approximate serialised size of the cached rows.
+    """
+
+    def __init__(self, maxsize: int, max_bytes: int, ttl: Optional[float], poll_interval: float):
+        self.tracker = TableChangeTracker(poll_interval)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, max_weight=max_bytes, weigh=lambda e: e[2])
+        self._invalidations = 0
+        self._skipped_lagging = 0
+
+    @staticmethod
+    def key(sql: str, limit: int) -> str:
+        return hashlib.sha1(f"{limit}:{normalize_sql(sql)}".encode()).hexdigest()
+
+    def get(self, sql: str, limit: int) -> Optional[ResultSet]:
+        self.tracker.ensure_started()
+        key = self.key(sql, limit)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        rows, versions, _ = entry
+        current = self.tracker.versions(t for t, _ in versions)
+        if current is None or current != versions:
+            self._cache.pop(key)
+            self._invalidations += 1
+            return None
+        return rows
+
+    def put(self, sql: str, limit: int, known_tables: Iterable[str], rows: ResultSet):
+        versions = self.tracker.versions(referenced_tables(sql, known_tables))
+        if versions is None:
+            return
+        # counters come from the primary; rows from a lagging replica may predate them
+        if not read_saw_writes_before(self.tracker.last_change_at()):
+            self._skipped_lagging += 1
+            return
+        size = len(orjson.dumps(rows.rows, default=str))
+        self._cache.put(self.key(sql, limit), (rows, versions, size))
+
+    def stats(self) -> Dict[str, object]:
+        s = self._cache.stats()
+        s["invalidations"] = self._invalidations
+        s["skipped_lagging_replica"] = self._skipped_lagging
+        s["tracker_fresh"] = self.tracker.fresh()
+        return s
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    global _result_cache
+    if not settings.result_cache_enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            maxsize=settings.result_cache_size,
+            max_bytes=settings.result_cache_max_bytes,
+            ttl=settings.result_cache_ttl or None,
+            poll_interval=settings.result_cache_poll_interval,
+        )
+    return _result_cache
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class TTLCache:
+    """Thread-safe LRU with per-entry expiry.
+
+    `maxsize` bounds the entry count; `max_weight` (with `weigh`) optionally
+    bounds the sum of entry weights, e.g. approximate bytes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        max_weight: Optional[int] = None,
+        weigh: Optional[Callable[[Any], int]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigh = weigh or (lambda _: 1)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at, weight)
+        self._weight = 0
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        _, _, w = self._data.pop(key)
+        self._weight -= w
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._stats.misses += 1
+                return default
+            value, expires, _ = item
+            if expires is not None and expires <= now:
+                self._drop(key)
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = (time.monotonic() + ttl) if ttl else None
+        weight = self.weigh(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if self.max_weight is not None and weight > self.max_weight:
+                return  # would evict everything else and still not fit
+            self._data[key] = (value, expires, weight)
+            self._weight += weight
+            self._stats.stores += 1
+            while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self._weight > self.max_weight
+            ):
+                self._drop(next(iter(self._data)))
+                self._stats.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._drop(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = asdict(self._stats)
+            out.update(size=len(self._data), maxsize=self.maxsize)
+            if self.max_weight is not None:
+                out.update(weight=self._weight, max_weight=self.max_weight)
+            return out
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -24,6 +24,91 @@ class Settings(BaseSettings):
     db_password: str = os.getenv('DB_PASSWORD')
     db_schema: str = os.getenv('DB_SCHEMA')
 
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 10
+    db_pool_timeout: float = 30.0  # seconds to wait for a free connection
+    db_pool_max_lifetime: float = 1800.0  # recycle connections older than this
+    db_pool_health_check_after: float = 30.0  # ping connections idle longer than this
+    db_fetch_batch_size: int = 1000  # rows per fetchmany() on server-side cursors
+    db_statement_timeout_ms: int = 30000  # session default on every pooled connection; 0 disables
+    db_work_mem: str = "16MB"
+    db_replicas: List[str] = []  # read replicas as libpq DSNs or URLs, e.g. '["host=replica1", "postgresql://replica2:5433"]'; missing fields come from DB_*
+    db_replica_max_lag: float = 30.0  # seconds of replay lag before a replica stops getting reads
+    db_replica_check_interval: float = 5.0  # seconds between replica health/lag checks
+    db_replica_connect_timeout: float = 5.0  # seconds to wait for a replica connection before failing over
+    db_replica_include_primary: bool = False  # balance reads onto the primary too; it is always the fallback
+    export_statement_timeout_ms: int = 300000  # /api/export cap (exports have no LIMIT); 0 = DB_STATEMENT_TIMEOUT_MS, -1 = no timeout
+
+    query_cost_fix_threshold: float = 1e7  # above: back to the fixer with a "too expensive" hint; 0 disables
+    query_cost_reject_threshold: float = 1e9  # above: refuse to run at all; 0 disables
+
+    session_backend: str = "memory"  # memory (per process) | sqlite (shared by workers on one host)
+    session_path: Optional[str] = None  # sqlite file; default ./sessions.sqlite3
+    session_max: int = 10000  # sessions kept; least recently used are dropped
+    session_max_bytes: int = 256 * 1024 * 1024  # memory backend: cap on encoded session bytes
+    session_idle_ttl: float = 86400.0  # seconds since the last turn; 0 disables
+
+    llm_max_retries: int = 3  # 429/5xx/timeouts, jittered exponential backoff (OpenAI SDK)
+    llm_timeout: float = 60.0
+    llm_max_connections: int = 100  # shared keep-alive HTTP pool for all models
+    llm_max_keepalive: int = 20
+    llm_keepalive_expiry: float = 60.0
+    llm_max_concurrency: int = 32  # in-flight requests per model; 0 = unlimited
+    llm_concurrency_overrides: Dict[str, int] = {}  # e.g. LLM_CONCURRENCY_OVERRIDES='{"gpt-4o": 8}'
+    llm_hedge: bool = False  # duplicate a request still pending after the model's recent p95 latency
+    llm_hedge_quantile: float = 0.95
+    llm_hedge_min_samples: int = 20  # latencies observed before hedging starts
+
+    prompt_token_budget: int = 8000  # max tokens per LLM prompt; over it, samples, old history, then tables are trimmed; 0 = unlimited
+    prompt_token_budgets: Dict[str, int] = {}  # overrides by "node", "model" or "model:node", e.g. '{"plan_sql": 12000}'
+
+    history_recent_turns: int = 6  # turns kept in full per session; older ones become one-line digests
+    history_summary_lines: int = 50  # digests kept
+    history_token_budget: int = 1000  # tokens for the history section of rephrase/respond prompts; 0 = unlimited
+
+    graph_skip_rephrase: bool = True  # no rephrase LLM call for self-contained questions
+    graph_fuse_rephrase_plan: bool = False  # rephrase and first SQL draft in one LLM call (skips the answer cache lookup)
+    graph_template_replies: bool = True  # zero rows or a single value are answered without the respond LLM call
+    respond_profile: bool = True  # respond sees per-column statistics of the whole result plus a few rows
+    respond_sample_rows: int = 5  # rows shown next to the profile (without it: the first 20)
+    profile_top_k: int = 5  # most frequent values listed per text column
+
+    plan_candidates: int = 1  # SQL drafts per question, validated concurrently; 1 = single draft + fix loop
+    plan_candidate_select: str = "first"  # first (first draft that runs) | cheapest (lowest EXPLAIN cost that runs)
+    plan_candidate_temperature: float = 0.7  # sampling temperature of the extra drafts
+
+    batch_workers: int = 8  # concurrent questions per batch (API default and CLI)
+    batch_max_workers: int = 32  # cap on what an /api/ask_batch request may ask for
+    batch_max_questions: int = 10000  # per /api/ask_batch request
+    batch_max_rows: int = 20  # result rows kept per answer in batch output
+
+    trace_log: bool = False  # one JSON line per request on the "agent.trace" logger
+    trace_log_file: Optional[str] = None  # default: stderr
+
+    schema_check_interval: float = 30.0  # seconds between catalog fingerprint checks
+    schema_resample_interval: float = 3600.0  # full reload (fresh samples) at most this often
+    schema_sample_method: str = "tablesample"  # tablesample | pg_stats | none
+    schema_sample_rows: int = 3
+    schema_sample_workers: int = 4
+    schema_sample_timeout_ms: int = 2000  # statement_timeout per sample query
+    schema_load_budget: float = 10.0  # seconds; sampling stops here and the snapshot is partial
+    schema_retrieval_top_k: int = 8  # tables ranked by BM25 for the planner; 0 sends the whole schema
+    schema_retrieval_fk_hops: int = 1
+    schema_retrieval_max_tables: int = 16  # schemas at or below this size are sent whole
+    schema_index_file: Optional[str] = None  # prebuilt index (python -m agent.schema_cache.index)
+    schema_cache_file: Optional[str] = str(ENV_FILE.parent / ".schema_snapshot.json")  # warm start; empty disables
+
+    answer_cache_enabled: bool = True
+    answer_cache_size: int = 1024
+    answer_cache_ttl: float = 86400.0  # seconds; 0 keeps entries until evicted
+    answer_cache_path: Optional[str] = None  # SQLite file for a persistent, shared tier
+
+    result_cache_enabled: bool = True
+    result_cache_size: int = 512
+    result_cache_max_bytes: int = 64 * 1024 * 1024  # approximate, by serialised row size
+    result_cache_ttl: float = 300.0
+    result_cache_poll_interval: float = 2.0  # pg_stat_user_tables poll period (staleness bound)
+
     app_timezone: str = os.getenv('APP_TIMEZONE')
 
 settings = Settings()
\ No newline at end of file
@@ -1,5 +1,51 @@
-from .connection import get_conn
-from .execute import run_select, explain
+from .connection import get_conn, aget_conn
+from .pool import (
+    get_pool,
+    close_pool,
+    get_async_pool,
+    close_async_pool,
+    pool_stats,
+    PoolTimeout,
+)
+from .replicas import get_router, close_replicas, aclose_replicas, replica_stats
+from .execute import (
+    run_select,
+    iter_select,
+    explain,
+    explain_estimate,
+    arun_select,
+    arun_select_result,
+    aiter_select,
+    aiter_select_batches,
+    aexplain,
+    aexplain_estimate,
+)
+from .cost import CostRejected
 from .introspect import load_schema_snapshot
 
-__all__ = ["get_conn", "run_select", "explain", "load_schema_snapshot"]
\ No newline at end of file
+__all__ = [
+    "get_conn",
+    "aget_conn",
+    "get_pool",
+    "close_pool",
+    "get_async_pool",
+    "close_async_pool",
+    "pool_stats",
+    "PoolTimeout",
+    "get_router",
+    "close_replicas",
+    "aclose_replicas",
+    "replica_stats",
+    "run_select",
+    "iter_select",
+    "explain",
+    "explain_estimate",
+    "arun_select",
+    "arun_select_result",
+    "aiter_select",
+    "aiter_select_batches",
+    "aexplain",
+    "aexplain_estimate",
+    "CostRejected",
+    "load_schema_snapshot",
+]
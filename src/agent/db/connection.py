@@ -1,17 +1,26 @@
-import psycopg2
-from contextlib import contextmanager
-from agent.config import settings
+from contextlib import asynccontextmanager, contextmanager
+from agent.db.pool import get_async_pool, get_pool
+from agent.db.replicas import get_router
 
 @contextmanager
-def get_conn():
-    conn = psycopg2.connect(
-        host=settings.db_host,
-        port=settings.db_port,
-        dbname=settings.db_name,
-        user=settings.db_user,
-        password=settings.db_password,
-    )
-    try:
-        yield conn
-    finally:
-        conn.close()
+def get_conn(primary: bool = False):
+    # pooled, read-only session; returned to the pool (rolled back) on exit.
+    # With DB_REPLICAS set it comes from the least busy healthy replica unless `primary` is asked for.
+    router = None if primary else get_router()
+    if router is None:
+        with get_pool().connection() as conn:
+            yield conn
+    else:
+        with router.connection() as conn:
+            yield conn
+
+@asynccontextmanager
+async def aget_conn(primary: bool = False):
+    router = None if primary else get_router()
+    if router is None:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            yield conn
+    else:
+        async with router.aconnection() as conn:
+            yield conn
@@ -0,0 +1,44 @@
+from typing import Any
+from agent.config import settings
+from agent.types import PlanEstimate
+
+
+class CostRejected(Exception):
+    """Raised instead of executing a query whose plan estimate is over a threshold."""
+
+    def __init__(self, estimate: PlanEstimate):
+        super().__init__(estimate.reason or "query rejected by cost estimate")
+        self.estimate = estimate
+
+
+def parse_plan(explain_json: Any) -> PlanEstimate:
+    """Top-level estimates from `EXPLAIN (FORMAT JSON)` output."""
+    doc = explain_json[0] if isinstance(explain_json, list) else explain_json
+    plan = doc["Plan"]
+    return PlanEstimate(
+        total_cost=float(plan.get("Total Cost", 0.0)),
+        startup_cost=float(plan.get("Startup Cost", 0.0)),
+        plan_rows=float(plan.get("Plan Rows", 0.0)),
+        node_type=plan.get("Node Type", ""),
+    )
+
+
+def admit(est: PlanEstimate) -> PlanEstimate:
+    """Fill in `decision`/`reason` from the configured cost thresholds."""
+    reject_at = settings.query_cost_reject_threshold
+    fix_at = settings.query_cost_fix_threshold
+    summary = f"estimated cost {est.total_cost:,.0f}, ~{est.plan_rows:,.0f} rows"
+    if reject_at and est.total_cost > reject_at:
+        est.decision = "reject"
+        est.reason = f"Query rejected: {summary} exceeds the limit of {reject_at:,.0f}."
+    elif fix_at and est.total_cost > fix_at:
+        est.decision = "fix"
+        est.reason = (
+            f"Query too expensive: {summary} (limit {fix_at:,.0f}). "
+            "Add selective filters (e.g. a date range), join on foreign keys instead of "
+            "producing a cross join, or aggregate before joining."
+        )
+    else:
+        est.decision = "allow"
+        est.reason = None
+    return est
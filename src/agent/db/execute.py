@@ -1,25 +1,159 @@
+import uuid
+from psycopg.rows import dict_row
 from psycopg2.extras import RealDictCursor
-from agent.db.connection import get_conn
+from agent.config import settings
+from agent.db.connection import aget_conn, get_conn
+from agent.db.cost import admit, parse_plan
+from agent.metrics import observe_db
+from agent.types import ResultSet
 
-READONLY_GUARD = "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY;"
-
-def run_select(sql, params = None, limit_default = 100):
+def _guard_select(sql, limit_default):
     if "select" not in sql.lower():
         raise ValueError("Only SELECT statements are allowed.")
-    if "limit" not in sql.lower():
+    if limit_default is not None and "limit" not in sql.lower():
         sql = f"{sql.rstrip(';')} LIMIT {limit_default};"
+    return sql
+
+def _guard_explain(sql):
+    if "select" not in sql.lower():
+        raise ValueError("Only SELECT explain supported.")
+    return f"EXPLAIN {sql}"
+
+_SET_TIMEOUT = "SELECT set_config('statement_timeout', %s, true)"
+
+def _cursor_name():
+    return f"agent_{uuid.uuid4().hex[:12]}"
+
+def run_select(sql, params = None, limit_default = 100):
+    sql = _guard_select(sql, limit_default)
     with get_conn() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(READONLY_GUARD)
-            cur.execute(sql, params or ())
-            rows = cur.fetchall()
-            return [dict(r) for r in rows]
+            with observe_db("select"):
+                cur.execute(sql, params or ())
+            # RealDictRow is already a dict; no second copy of the result
+            return cur.fetchall()
+
+def iter_select(sql, params = None, limit_default = None, batch_size = None, statement_timeout_ms = None):
+    """Yield rows lazily from a named (server-side) cursor, `batch_size` at a time.
+
+    No auto-LIMIT is applied unless `limit_default` is given. The pooled
+    connection is held until the generator is exhausted or closed.
+    `statement_timeout_ms` overrides the connection default for this query only.
+    """
+    sql = _guard_select(sql, limit_default)
+    batch_size = batch_size or settings.db_fetch_batch_size
+    with get_conn() as conn:
+        if statement_timeout_ms is not None:
+            with conn.cursor() as cur:
+                with observe_db("set"):
+                    cur.execute(_SET_TIMEOUT, (str(int(statement_timeout_ms)),))
+        with conn.cursor(name=_cursor_name(), cursor_factory=RealDictCursor) as cur:
+            cur.itersize = batch_size
+            with observe_db("declare"):
+                cur.execute(sql, params or ())
+            while True:
+                with observe_db("fetch"):
+                    batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield from batch
 
 def explain(sql: str) -> str:
-    if "select" not in sql.lower():
-        raise ValueError("Only SELECT explain supported.")
+    sql = _guard_explain(sql)
     with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(READONLY_GUARD)
-        cur.execute(f"EXPLAIN {sql}")
+        with observe_db("explain"):
+            cur.execute(sql)
         plan = "\n".join(r[0] for r in cur.fetchall())
         return plan
+
+def explain_estimate(sql: str, limit_default = 100):
+    """Planner estimate for the statement `run_select` would send, with the admission decision."""
+    sql = f"EXPLAIN (FORMAT JSON) {_guard_select(sql, limit_default)}"
+    with get_conn() as conn, conn.cursor() as cur:
+        with observe_db("explain"):
+            cur.execute(sql)
+        return admit(parse_plan(cur.fetchone()[0]))
+
+async def arun_select(sql, params = None, limit_default = 100):
+    sql = _guard_select(sql, limit_default)
+    async with aget_conn() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            with observe_db("select"):
+                await cur.execute(sql, params)
+            return await cur.fetchall()
+
+def _column_types(conn, description):
+    out = []
+    for col in description:
+        info = conn.adapters.types.get(col.type_code)
+        out.append(info.name if info is not None else str(col.type_code))
+    return out
+
+async def arun_select_result(sql, params = None, limit_default = 100) -> ResultSet:
+    """`arun_select` as a `ResultSet`: row tuples from the cursor, no per-row dicts."""
+    sql = _guard_select(sql, limit_default)
+    async with aget_conn() as conn:
+        async with conn.cursor() as cur:
+            with observe_db("select"):
+                await cur.execute(sql, params)
+            rows = await cur.fetchall() if cur.description else []
+            description = cur.description or []
+            return ResultSet([c.name for c in description], _column_types(conn, description), rows)
+
+async def aiter_select_batches(sql, params = None, limit_default = None, batch_size = None, statement_timeout_ms = None):
+    """`aiter_select` yielding one `ResultSet` per fetched batch (same columns and types in each)."""
+    sql = _guard_select(sql, limit_default)
+    batch_size = batch_size or settings.db_fetch_batch_size
+    async with aget_conn() as conn:
+        if statement_timeout_ms is not None:
+            with observe_db("set"):
+                await conn.execute(_SET_TIMEOUT, (str(int(statement_timeout_ms)),))
+        async with conn.cursor(name=_cursor_name()) as cur:
+            with observe_db("declare"):
+                await cur.execute(sql, params)
+            columns = types = None
+            while True:
+                with observe_db("fetch"):
+                    batch = await cur.fetchmany(batch_size)
+                if columns is None:
+                    description = cur.description or []
+                    columns, types = [c.name for c in description], _column_types(conn, description)
+                elif not batch:
+                    break
+                # an empty result still yields one (empty) batch, so the columns are known
+                yield ResultSet(columns, types, batch)
+                if not batch:
+                    break
+
+async def aiter_select(sql, params = None, limit_default = None, batch_size = None, statement_timeout_ms = None):
+    """Async counterpart of `iter_select` on the async pool."""
+    sql = _guard_select(sql, limit_default)
+    batch_size = batch_size or settings.db_fetch_batch_size
+    async with aget_conn() as conn:
+        if statement_timeout_ms is not None:
+            with observe_db("set"):
+                await conn.execute(_SET_TIMEOUT, (str(int(statement_timeout_ms)),))
+        async with conn.cursor(name=_cursor_name(), row_factory=dict_row) as cur:
+            with observe_db("declare"):
+                await cur.execute(sql, params)
+            while True:
+                with observe_db("fetch"):
+                    batch = await cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row
+
+async def aexplain(sql: str) -> str:
+    sql = _guard_explain(sql)
+    async with aget_conn() as conn, conn.cursor() as cur:
+        with observe_db("explain"):
+            await cur.execute(sql)
+        return "\n".join(r[0] for r in await cur.fetchall())
+
+async def aexplain_estimate(sql: str, limit_default = 100):
+    sql = f"EXPLAIN (FORMAT JSON) {_guard_select(sql, limit_default)}"
+    async with aget_conn() as conn, conn.cursor() as cur:
+        with observe_db("explain"):
+            await cur.execute(sql)
+        return admit(parse_plan((await cur.fetchone())[0]))
@@ -1,73 +1,218 @@
-from typing import Dict
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, List, Optional
 from psycopg2.extras import RealDictCursor
 from agent.config import settings
 from agent.db.connection import get_conn
 from agent.types import SchemaSnapshot, Table, Column, ForeignKey
 
+log = logging.getLogger(__name__)
 
-def load_schema_snapshot() -> SchemaSnapshot:
+# relkinds we describe: tables, partitioned tables, views, matviews, foreign tables
+_RELKINDS = "('r', 'p', 'v', 'm', 'f')"
+# row samples are only taken from relations that hold their own data
+_SAMPLEABLE = {"r", "p", "m"}
+
+# One md5 per relation over its attributes and PK/FK definitions. Any DDL that
+# would change what load_schema_snapshot() returns for a table changes its hash.
+_FINGERPRINT_EXPR = """
+    md5(
+      coalesce((
+        SELECT string_agg(
+                 a.attname || ':' || format_type(a.atttypid, a.atttypmod) || ':' ||
+                 a.attnotnull::text || ':' || coalesce(pg_get_expr(d.adbin, d.adrelid), ''),
+                 ',' ORDER BY a.attnum)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+      ), '') || '|' ||
+      coalesce((
+        SELECT string_agg(con.conname || ':' || pg_get_constraintdef(con.oid), ',' ORDER BY con.conname)
+        FROM pg_constraint con
+        WHERE con.conrelid = c.oid AND con.contype IN ('p', 'f')
+      ), '')
+    )
+"""
+
+FINGERPRINT_SQL = f"""
+    SELECT c.relname AS table_name, {_FINGERPRINT_EXPR} AS fingerprint
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind IN {_RELKINDS}
+"""
+
+# Columns, PK and FKs for every relation in one round trip, one row per table.
+CATALOG_SQL = f"""
+    SELECT c.relname AS table_name,
+           c.relkind,
+           c.reltuples,
+           {_FINGERPRINT_EXPR} AS fingerprint,
+           coalesce((
+             SELECT json_agg(json_build_object(
+                      'name', a.attname,
+                      'data_type', format_type(a.atttypid, NULL),
+                      'nullable', NOT a.attnotnull,
+                      'default', pg_get_expr(d.adbin, d.adrelid)
+                    ) ORDER BY a.attnum)
+             FROM pg_attribute a
+             LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+             WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+           ), '[]') AS columns,
+           coalesce((
+             SELECT json_agg(a.attname ORDER BY k.ord)
+             FROM pg_constraint con
+             CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+             WHERE con.conrelid = c.oid AND con.contype = 'p'
+           ), '[]') AS primary_key,
+           coalesce((
+             SELECT json_agg(json_build_object(
+                      'column', a.attname, 'ref_table', rc.relname, 'ref_column', ra.attname
+                    ) ORDER BY con.conname, k.ord)
+             FROM pg_constraint con
+             CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, refnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+             JOIN pg_class rc ON rc.oid = con.confrelid
+             JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = k.refnum
+             WHERE con.conrelid = c.oid AND con.contype = 'f'
+           ), '[]') AS foreign_keys
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind IN {_RELKINDS}
+"""
+
+PG_STATS_SQL = """
+    SELECT tablename, attname, most_common_vals::text::text[] AS mcv
+    FROM pg_stats
+    WHERE schemaname = %s AND tablename = ANY(%s) AND most_common_vals IS NOT NULL
+"""
+
+
+def table_fingerprints() -> Dict[str, str]:
+    with get_conn(primary=True) as conn, conn.cursor() as cur:
+        cur.execute(FINGERPRINT_SQL, (settings.db_schema,))
+        return {name: fp for name, fp in cur.fetchall()}
+
+
+def _read_catalog(only: Optional[List[str]]):
+    sql, args = CATALOG_SQL, (settings.db_schema,)
+    if only is not None:
+        sql, args = sql + " AND c.relname = ANY(%s)", (settings.db_schema, only)
+    with get_conn(primary=True) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, args)
+        return cur.fetchall()
+
+
+def _sample_one(schema: str, table: str, reltuples: float, n: int) -> List[dict]:
+    """Up to `n` rows; TABLESAMPLE on large tables so we only touch a few pages."""
+    with get_conn(primary=True) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SET LOCAL statement_timeout = %s", (int(settings.schema_sample_timeout_ms),))
+        rows = []
+        if reltuples > 10_000:
+            pct = min(100.0, max(0.001, 100.0 * n * 50 / reltuples))
+            cur.execute(f'SELECT * FROM "{schema}"."{table}" TABLESAMPLE SYSTEM ({pct:.4f}) LIMIT {int(n)};')
+            rows = cur.fetchall()
+        if not rows:
+            cur.execute(f'SELECT * FROM "{schema}"."{table}" LIMIT {int(n)};')
+            rows = cur.fetchall()
+        return rows
+
+
+def _sample_from_stats(schema: str, tables: List[str], n: int) -> Dict[str, List[dict]]:
+    """Pseudo-rows built from pg_stats most-common values; no table is read.
+
+    Each row combines the i-th most common value of every column, so the rows
+    illustrate value formats rather than real records.
+    """
+    per_table: Dict[str, Dict[str, list]] = {}
+    with get_conn(primary=True) as conn, conn.cursor() as cur:
+        cur.execute(PG_STATS_SQL, (schema, tables))
+        for table, col, mcv in cur.fetchall():
+            per_table.setdefault(table, {})[col] = mcv or []
+    out = {}
+    for table, cols in per_table.items():
+        depth = min(n, max(len(v) for v in cols.values()))
+        out[table] = [{c: (v[i] if i < len(v) else None) for c, v in cols.items()} for i in range(depth)]
+    return out
+
+
+def sample_tables(snapshot: SchemaSnapshot, tables: Iterable[str], reltuples: Optional[Dict[str, float]] = None,
+                  budget: Optional[float] = None) -> List[str]:
+    """Fill `sample_rows` for `tables` in place, in parallel, within `budget` seconds.
+
+    Returns the tables that could not be sampled before the budget ran out.
+    """
+    method = settings.schema_sample_method
+    n = settings.schema_sample_rows
+    names = [t for t in tables if t in snapshot.tables]
+    if method == "none" or not names or n <= 0:
+        return []
+    schema = snapshot.schema_name
+    if method == "pg_stats":
+        for t, rows in _sample_from_stats(schema, names, n).items():
+            snapshot.tables[t].sample_rows = rows
+        return []
+
+    reltuples = reltuples or {}
+    budget = settings.schema_load_budget if budget is None else budget
+    deadline = time.monotonic() + budget
+    pending = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, settings.schema_sample_workers), thread_name_prefix="schema-sample")
+    try:
+        for t in names:
+            pending[pool.submit(_sample_one, schema, t, reltuples.get(t, -1.0), n)] = t
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                t = pending.pop(fut)
+                try:
+                    snapshot.tables[t].sample_rows = fut.result()
+                except Exception as e:
+                    log.warning("sampling %s.%s failed: %s", schema, t, e)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    left = sorted(pending.values())
+    if left:
+        log.warning("schema sampling budget (%.1fs) exhausted; %d table(s) left unsampled", budget, len(left))
+    return left
+
+
+def load_schema_snapshot(tables: Optional[Iterable[str]] = None, budget: Optional[float] = None) -> SchemaSnapshot:
+    """Introspect the configured schema, or only `tables` when given.
+
+    Structure comes from a single pg_catalog query; samples are then taken in
+    parallel on pooled connections. Tables whose samples did not make it
+    within `budget` (default `schema_load_budget`) are listed in
+    `SchemaSnapshot.unsampled`.
+    """
     schema = settings.db_schema
-    with get_conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("""
-            SELECT c.table_name, c.column_name, c.is_nullable, c.data_type, c.column_default
-            FROM information_schema.columns c
-            WHERE c.table_schema = %s
-            ORDER BY c.table_name, c.ordinal_position
-        """, (schema,))
-        cols = list(cur.fetchall())
-
-        cur.execute("""
-            SELECT tc.table_name, kcu.column_name, ccu.table_name AS ref_table, ccu.column_name AS ref_column
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-              ON tc.constraint_name = kcu.constraint_name
-             AND tc.table_schema = kcu.table_schema
-            JOIN information_schema.constraint_column_usage ccu
-              ON ccu.constraint_name = tc.constraint_name
-             AND ccu.table_schema = tc.table_schema
-            WHERE tc.table_schema = %s AND tc.constraint_type = 'FOREIGN KEY'
-        """, (schema,))
-        fks = list(cur.fetchall())
-
-        cur.execute("""
-            SELECT tc.table_name, kcu.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-              ON tc.constraint_name = kcu.constraint_name
-             AND tc.table_schema = kcu.table_schema
-            WHERE tc.table_schema = %s AND tc.constraint_type = 'PRIMARY KEY'
-        """, (schema,))
-        pks = list(cur.fetchall())
-
-        tables: Dict[str, Table] = {}
-        for r in cols:
-            t = r["table_name"]
-            tables.setdefault(t, Table(
-                name=t, columns=[], primary_key=[], foreign_keys=[], sample_rows=[]
-            ))
-            tables[t].columns.append(Column(
-                name=r["column_name"],
-                data_type=r["data_type"],
-                nullable=(r["is_nullable"] == "YES"),
-                default=r["column_default"],
-            ))
-
-        for r in pks:
-            t = r["table_name"]
-            if t in tables:
-                tables[t].primary_key.append(r["column_name"])
-
-        for r in fks:
-            t = r["table_name"]
-            if t in tables:
-                tables[t].foreign_keys.append(ForeignKey(
-                    table=t, column=r["column_name"], ref_table=r["ref_table"], ref_column=r["ref_column"]
-                ))
-
-        for t in tables.keys():
-            cur.execute(f'SELECT * FROM "{schema}"."{t}" LIMIT 3;')
-            rows = [dict(x) for x in cur.fetchall()]
-            tables[t].sample_rows = rows
-
-        return SchemaSnapshot(schema_name=schema, tables=tables)
+    t0 = time.monotonic()
+    rows = _read_catalog(list(tables) if tables is not None else None)
+
+    out: Dict[str, Table] = {}
+    fps: Dict[str, str] = {}
+    reltuples: Dict[str, float] = {}
+    sampleable = []
+    for r in sorted(rows, key=lambda r: r["table_name"]):
+        t = r["table_name"]
+        out[t] = Table(
+            name=t,
+            columns=[Column(**c) for c in r["columns"]],
+            primary_key=list(r["primary_key"]),
+            foreign_keys=[ForeignKey(table=t, **fk) for fk in r["foreign_keys"]],
+            sample_rows=[],
+        )
+        fps[t] = r["fingerprint"]
+        reltuples[t] = float(r["reltuples"] or -1)
+        if r["relkind"] in _SAMPLEABLE:
+            sampleable.append(t)
 
+    snap = SchemaSnapshot(schema=schema, tables=out, table_fingerprints=fps)
+    if budget is None:
+        budget = settings.schema_load_budget
+    snap.unsampled = sample_tables(snap, sampleable, reltuples, budget=max(0.0, budget - (time.monotonic() - t0)))
+    return snap
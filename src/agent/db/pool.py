@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import psycopg2
+from psycopg_pool import AsyncConnectionPool
+from agent.config import settings
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+@dataclass
+class PoolStats:
+    opened: int = 0
+    closed: int = 0
+    checkouts: int = 0
+    waits: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    timeouts: int = 0
+    health_check_failures: int = 0
+    expired: int = 0
+
+
+@dataclass
+class _Pooled:
+    conn: object
+    created: float
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def conninfo() -> Dict[str, object]:
+    info = dict(
+        host=settings.db_host,
+        port=settings.db_port,
+        dbname=settings.db_name,
+        user=settings.db_user,
+        password=settings.db_password,
+    )
+    # server-side caps for every statement on the connection, set at startup (no extra round trip)
+    opts = []
+    if settings.db_statement_timeout_ms:
+        opts.append(f"-c statement_timeout={int(settings.db_statement_timeout_ms)}")
+    if settings.db_work_mem:
+        opts.append(f"-c work_mem={settings.db_work_mem}")
+    if opts:
+        info["options"] = " ".join(opts)
+    return info
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool.
+
+    Connections are opened read-only once, pinged when they have been idle for
+    longer than `health_check_after` and recycled after `max_lifetime`.
+    """
+
+    def __init__(
+        self,
+        dsn: Dict[str, object],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_lifetime: float = 1800.0,
+        health_check_after: float = 30.0,
+        name: str = "primary",
+    ):
+        self.dsn = dsn
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._cond = threading.Condition()
+        self._idle: List[_Pooled] = []
+        self._busy: Dict[int, _Pooled] = {}
+        self._size = 0
+        self._closed = False
+        self._stats = PoolStats()
+
+    def open(self) -> "ConnectionPool":
+        for _ in range(self.min_size):
+            with self._cond:
+                if self._size >= self.min_size:
+                    break
+                self._size += 1
+            try:
+                entry = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._idle.append(entry)
+        return self
+
+    def _connect(self) -> _Pooled:
+        conn = psycopg2.connect(**self.dsn)
+        # applied once per physical connection instead of once per statement
+        conn.set_session(readonly=True, autocommit=False)
+        now = time.monotonic()
+        with self._cond:
+            self._stats.opened += 1
+        return _Pooled(conn=conn, created=now, last_used=now)
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _discard(self, entry: _Pooled):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats.closed += 1
+        self._release_slot()
+
+    def _expired(self, entry: _Pooled, now: float) -> bool:
+        return bool(self.max_lifetime) and now - entry.created > self.max_lifetime
+
+    def _healthy(self, entry: _Pooled, now: float) -> bool:
+        if entry.conn.closed:
+            return False
+        if now - entry.last_used < self.health_check_after:
+            return True
+        try:
+            with entry.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            entry.conn.rollback()
+            return True
+        except Exception as e:
+            log.warning("pool %s: dropping connection that failed health check: %s", self.name, e)
+            with self._cond:
+                self._stats.health_check_failures += 1
+            return False
+
+    def _take(self, deadline: float) -> Optional[_Pooled]:
+        """Pop an idle connection, or reserve a slot for a new one (returns None)."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f"pool {self.name} is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats.timeouts += 1
+                    raise PoolTimeout(
+                        f"pool {self.name}: no connection available after {self.timeout:.1f}s"
+                    )
+                self._cond.wait(remaining)
+
+    def getconn(self):
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        while True:
+            entry = self._take(deadline)
+            if entry is None:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                break
+            now = time.monotonic()
+            if self._expired(entry, now):
+                with self._cond:
+                    self._stats.expired += 1
+                self._discard(entry)
+                continue
+            if self._healthy(entry, now):
+                break
+            self._discard(entry)
+
+        waited = time.monotonic() - t0
+        with self._cond:
+            self._busy[id(entry.conn)] = entry
+            self._stats.checkouts += 1
+            self._stats.wait_seconds_total += waited
+            self._stats.wait_seconds_max = max(self._stats.wait_seconds_max, waited)
+            if waited > 0.001:
+                self._stats.waits += 1
+        return entry.conn
+
+    def putconn(self, conn, discard: bool = False):
+        with self._cond:
+            entry = self._busy.pop(id(conn), None)
+        if entry is None:
+            return
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        if discard or conn.closed or self._closed or self._expired(entry, now):
+            if not discard and not conn.closed and self._expired(entry, now):
+                with self._cond:
+                    self._stats.expired += 1
+            self._discard(entry)
+            return
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            s = self._stats
+            return {
+                "name": self.name,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._busy),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "opened": s.opened,
+                "closed": s.closed,
+                "expired": s.expired,
+                "checkouts": s.checkouts,
+                "waits": s.waits,
+                "wait_seconds_total": round(s.wait_seconds_total, 6),
+                "wait_seconds_max": round(s.wait_seconds_max, 6),
+                "timeouts": s.timeouts,
+                "health_check_failures": s.health_check_failures,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def make_pool(dsn: Dict[str, object], name: str = "primary", timeout: Optional[float] = None) -> ConnectionPool:
+    return ConnectionPool(
+        dsn,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+        timeout=timeout or settings.db_pool_timeout,
+        max_lifetime=settings.db_pool_max_lifetime,
+        health_check_after=settings.db_pool_health_check_after,
+        name=name,
+    ).open()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = make_pool(conninfo())
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+_apool: Optional[AsyncConnectionPool] = None
+_apool_lock: Optional[asyncio.Lock] = None
+_last_used: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+async def _aconfigure(conn):
+    await conn.set_read_only(True)
+
+
+async def _acheck(conn):
+    # same policy as the sync pool: only ping connections that sat idle for a while
+    last = _last_used.get(conn)
+    if last is not None and time.monotonic() - last < settings.db_pool_health_check_after:
+        return
+    await AsyncConnectionPool.check_connection(conn)
+
+
+async def _areset(conn):
+    _last_used[conn] = time.monotonic()
+
+
+async def make_async_pool(dsn: Dict[str, object], name: str = "primary", timeout: Optional[float] = None) -> AsyncConnectionPool:
+    pool = AsyncConnectionPool(
+        kwargs=dsn,
+        min_size=settings.db_pool_min_size,
+        max_size=max(settings.db_pool_max_size, settings.db_pool_min_size, 1),
+        timeout=timeout or settings.db_pool_timeout,
+        max_lifetime=settings.db_pool_max_lifetime,
+        configure=_aconfigure,
+        check=_acheck,
+        reset=_areset,
+        name=f"{name}-async",
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    global _apool, _apool_lock
+    if _apool is not None:
+        return _apool
+    if _apool_lock is None:
+        _apool_lock = asyncio.Lock()
+    async with _apool_lock:
+        if _apool is None:
+            _apool = await make_async_pool(conninfo())
+    return _apool
+
+
+async def close_async_pool():
+    global _apool, _apool_lock
+    if _apool is not None:
+        await _apool.close()
+    _apool = None
+    _apool_lock = None
+
+
+def pool_stats() -> Dict[str, object]:
+    return {
+        "sync": _pool.stats() if _pool is not None else {},
+        "async": _apool.get_stats() if _apool is not None else {},
+    }
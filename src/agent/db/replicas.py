@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import psycopg
+import psycopg2
+import psycopg_pool
+from psycopg2.extensions import parse_dsn
+from agent.config import settings
+from agent.db.pool import PoolTimeout, conninfo, get_async_pool, get_pool, make_async_pool, make_pool
+from agent.metrics import record_failover, record_replica_lag, record_route
+
+log = logging.getLogger(__name__)
+
+# seconds behind the primary; a replica that has replayed everything it received is
+# current even when the primary has been idle (the replay timestamp alone would age)
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def replica_conninfo(dsn: str) -> Dict[str, object]:
+    """Connection kwargs for one DB_REPLICAS entry; fields it leaves out come from the primary's."""
+    info = {**conninfo(), **parse_dsn(dsn)}
+    info.setdefault("connect_timeout", max(1, math.ceil(settings.db_replica_connect_timeout)))
+    return info
+
+
+class Backend:
+    """One server reads can go to: its sync and async pools plus routing state."""
+
+    def __init__(self, name: str, dsn: Dict[str, object], primary: bool = False):
+        self.name = name
+        self.dsn = dsn
+        self.primary = primary
+        self.healthy = True  # until a check or a connection attempt says otherwise
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.outstanding = 0
+        self.routed = 0
+        self.failovers = 0
+        self.checked_at: Optional[float] = None
+        self.caught_up_at: Optional[float] = None  # monotonic time of the last check that found no lag
+        self._pool = None
+        self._apool = None
+        self._stale_pools: list = []  # pools from before the last outage, closed once it is back
+        self._stale_apools: list = []
+        self._lock = threading.Lock()
+        self._alock: Optional[asyncio.Lock] = None
+        self._check_conn = None
+
+    def usable(self, max_lag: float) -> bool:
+        return self.healthy and (not max_lag or self.lag is None or self.lag <= max_lag)
+
+    def pool(self):
+        if self.primary:
+            return get_pool()
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    stale, self._stale_pools = self._stale_pools, []
+                    for pool in stale:
+                        pool.close()
+                    self._pool = make_pool(self.dsn, name=self.name, timeout=settings.db_replica_connect_timeout)
+        return self._pool
+
+    async def apool(self):
+        if self.primary:
+            return await get_async_pool()
+        if self._apool is None:
+            if self._alock is None:
+                self._alock = asyncio.Lock()
+            async with self._alock:
+                if self._apool is None:
+                    stale, self._stale_apools = self._stale_apools, []
+                    for pool in stale:
+                        await pool.close()
+                    self._apool = await make_async_pool(self.dsn, name=self.name, timeout=settings.db_replica_connect_timeout)
+        return self._apool
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+            self.routed += 1
+        record_route(self.name)
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+
+    def mark_down(self, error):
+        with self._lock:
+            was_up, self.healthy, self.error = self.healthy, False, str(error).strip()
+            self.caught_up_at = None
+            if was_up:
+                # idle connections in these pools died with the server; start over once it is back
+                if self._pool is not None:
+                    self._stale_pools.append(self._pool)
+                if self._apool is not None:
+                    self._stale_apools.append(self._apool)
+                self._pool = self._apool = None
+        if was_up:
+            log.warning("replica %s is down, reads fail over: %s", self.name, self.error)
+
+    def mark_up(self, lag: float):
+        max_lag = settings.db_replica_max_lag
+        with self._lock:
+            was_usable = self.usable(max_lag)
+            self.healthy, self.lag, self.error = True, lag, None
+            self.checked_at = time.time()
+            self.caught_up_at = time.monotonic() if lag == 0 else None
+        record_replica_lag(self.name, lag)
+        if was_usable != self.usable(max_lag):
+            if was_usable:
+                log.warning("replica %s is %.1fs behind (max %.1fs), reads skip it", self.name, lag, max_lag)
+            else:
+                log.info("replica %s is back (lag %.1fs)", self.name, lag)
+
+    def check(self):
+        """Ping over a dedicated connection and read the replay lag."""
+        try:
+            if self._check_conn is None or self._check_conn.closed:
+                self._check_conn = psycopg2.connect(**self.dsn)
+                self._check_conn.autocommit = True  # now() per check, not per transaction
+            with self._check_conn.cursor() as cur:
+                cur.execute(LAG_SQL)
+                lag = float(cur.fetchone()[0])
+        except Exception as e:
+            self.close_check()
+            with self._lock:
+                self.checked_at = time.time()
+            self.mark_down(e)
+            return
+        self.mark_up(lag)
+
+    def close_check(self):
+        conn, self._check_conn = self._check_conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out = {
+                "name": self.name,
+                "host": self.dsn.get("host"),
+                "port": self.dsn.get("port"),
+                "healthy": self.healthy,
+                "lag_seconds": self.lag,
+                "outstanding": self.outstanding,
+                "routed": self.routed,
+                "failovers": self.failovers,
+                "checked_at": self.checked_at,
+                "error": self.error,
+            }
+        if not self.primary:
+            out["sync"] = self._pool.stats() if self._pool is not None else {}
+            out["async"] = self._apool.get_stats() if self._apool is not None else {}
+        return out
+
+
+# the backend that served the latest read in this context, and when it was handed out
+_served: ContextVar[Optional[Tuple[Backend, float]]] = ContextVar("agent_db_served", default=None)
+
+
+def read_saw_writes_before(t: float) -> bool:
+    """Whether the latest read in this context saw every write committed before monotonic time `t`.
+
+    True for the primary. A replica qualifies only if a check after `t`,
+    but before the read started, found it fully caught up.
+    """
+    served = _served.get()
+    if served is None or served[0].primary:
+        return True
+    backend, started = served
+    caught_up = backend.caught_up_at
+    return caught_up is not None and t <= caught_up <= started
+
+
+class ReplicaRouter:
+    """Spreads read connections over healthy replicas by least outstanding requests.
+
+    A background thread checks every replica's health and replay lag each
+    DB_REPLICA_CHECK_INTERVAL seconds; replicas that are down or lag more
+    than DB_REPLICA_MAX_LAG get no new reads. A replica that refuses a
+    connection is marked down on the spot; one that is only saturated is
+    skipped for that read. Either way the read moves to the next backend,
+    with the primary as the last resort.
+    """
+
+    def __init__(self, replicas: List[Backend], primary: Backend):
+        self.replicas = replicas
+        self.primary = primary
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ReplicaRouter":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="replica-checks", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            for backend in self.replicas:
+                backend.check()
+            self._stop.wait(settings.db_replica_check_interval)
+
+    def candidates(self) -> List[Backend]:
+        """Backends to try, in order: usable replicas by fewest outstanding reads, then the primary."""
+        pool = [b for b in self.replicas if b.usable(settings.db_replica_max_lag)]
+        if settings.db_replica_include_primary:
+            pool.append(self.primary)
+        random.shuffle(pool)  # ties go to a random backend, not always the first listed
+        pool.sort(key=lambda b: b.outstanding)
+        if self.primary not in pool:
+            pool.append(self.primary)
+        return pool
+
+    def _failed(self, backend: Backend, error, down: bool):
+        if backend is self.primary:
+            raise error
+        with backend._lock:
+            backend.failovers += 1
+        record_failover(backend.name)
+        if down:
+            backend.mark_down(error)
+        else:
+            log.info("replica %s has no free connection, trying the next backend", backend.name)
+
+    @contextmanager
+    def connection(self):
+        with ExitStack() as stack:
+            for backend in self.candidates():
+                try:
+                    conn = stack.enter_context(backend.pool().connection())
+                except PoolTimeout as e:  # busy, not broken
+                    self._failed(backend, e, down=False)
+                    continue
+                except psycopg2.OperationalError as e:
+                    self._failed(backend, e, down=True)
+                    continue
+                break
+            backend.acquire()
+            stack.callback(backend.release)
+            _served.set((backend, time.monotonic()))
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if conn.closed and backend is not self.primary:
+                    backend.mark_down(e)
+                raise
+
+    @asynccontextmanager
+    async def aconnection(self):
+        async with AsyncExitStack() as stack:
+            for backend in self.candidates():
+                try:
+                    pool = await backend.apool()
+                    conn = await stack.enter_async_context(pool.connection())
+                except psycopg_pool.PoolTimeout as e:
+                    # busy, or a dead server the pool keeps reconnecting to; only the health check decides which
+                    self._failed(backend, e, down=False)
+                    continue
+                except psycopg.OperationalError as e:
+                    self._failed(backend, e, down=True)
+                    continue
+                break
+            backend.acquire()
+            stack.callback(backend.release)
+            _served.set((backend, time.monotonic()))
+            try:
+                yield conn
+            except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+                if (conn.closed or conn.broken) and backend is not self.primary:
+                    backend.mark_down(e)
+                raise
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_lag_seconds": settings.db_replica_max_lag,
+            "include_primary": settings.db_replica_include_primary,
+            "backends": [b.stats() for b in self.replicas] + [self.primary.stats()],
+        }
+
+    def close(self):
+        self._stop.set()
+        for backend in self.replicas:
+            backend.close_check()
+            pools, backend._stale_pools = backend._stale_pools + [backend._pool], []
+            backend._pool = None
+            for pool in pools:
+                if pool is not None:
+                    pool.close()
+
+    async def aclose(self):
+        for backend in self.replicas:
+            pools, backend._stale_apools = backend._stale_apools + [backend._apool], []
+            backend._apool = None
+            backend._alock = None
+            for pool in pools:
+                if pool is not None:
+                    await pool.close()
+
+
+_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Optional[ReplicaRouter]:
+    """The process-wide router, or None when no DB_REPLICAS are configured."""
+    global _router
+    if _router is None and settings.db_replicas:
+        with _router_lock:
+            if _router is None:
+                replicas = [
+                    Backend(f"replica-{i}", replica_conninfo(dsn)) for i, dsn in enumerate(settings.db_replicas, 1)
+                ]
+                _router = ReplicaRouter(replicas, Backend("primary", conninfo(), primary=True)).start()
+    return _router
+
+
+def close_replicas():
+    global _router
+    with _router_lock:
+        if _router is not None:
+            _router.close()
+            _router = None
+
+
+async def aclose_replicas():
+    if _router is not None:
+        await _router.aclose()
+
+
+def replica_stats() -> Dict[str, object]:
+    return _router.stats() if _router is not None else {}
@@ -1,80 +1,205 @@
+import asyncio
 from typing import TypedDict, Optional
-from langgraph.graph import StateGraph, END
-from agent.types import ConversationTurn
-from agent.llm.nodes.respond import respond_node
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, START, END
+from agent.cache.answer_cache import answer_key, get_answer_cache
+from agent.db.cost import CostRejected
+from agent.history import ConversationHistory
+from agent.types import ConversationTurn, ResultSet
+from agent.config import settings
+from agent.llm.nodes.respond import respond_node, template_reply
 from agent.llm.nodes.rephrase import rephrase_node
+from agent.llm.nodes.rephrase_plan import rephrase_plan_node
 from agent.types import QueryContext
 from agent.schema_cache.cache import get_schema_snapshot
-from agent.llm.nodes.plan_sql import plan_sql_node
-from agent.llm.nodes.validate_fix import validate_fix_node
+from agent.schema_cache.index import select_tables
+from agent.llm.nodes.plan_sql import plan_sql_candidates, plan_sql_node
+from agent.llm.nodes.validate_fix import validate_candidates_node, validate_fix_node
 from agent.llm.nodes.run_query import run_query_node
+from agent.metrics import record_cache, record_fix_attempts, traced
+from agent.result_profile import profile_result
+from agent.utils.utility import needs_rephrase
 
 
 class AgentState(TypedDict, total=False):
     user_query: str
     now_iso: str
     timezone: str
-    previous_turns: list[ConversationTurn]
+    history: ConversationHistory  # appended to in place by respond / reply
+    history_json: str  # history section rendered once per turn, shared by rephrase and respond
     rephrased: str
     schema: object
+    schema_tables: list[str] | None  # retrieval subset shown to the LLM; None = whole schema
     sql_draft: str
+    sql_candidates: list[str]  # distinct drafts from plan_sql (several with PLAN_CANDIDATES > 1)
     validated_sql: str | None
     result_rows: list[dict]
+    result_set: ResultSet | None  # the same rows, columnar with column types (None when nothing ran)
+    result_profile: dict | None  # per-column statistics for respond
     rowcount: int
+    executed: bool  # result_rows already hold the result of validated_sql
     reply_text: str
     error: Optional[str]
+    answer_key: str
+    answer_cache_hit: bool  # validated_sql came from the answer cache; planning was skipped
+    answer_cache_stale: bool  # cached SQL failed to run; re-plan
+    cost_estimate: dict | None  # planner estimate and admission decision for the last probed SQL
+
+def _schema_context(question: str):
+    schema = get_schema_snapshot()
+    return schema, select_tables(schema, question)
+
+def _with_targets(tables, target_tables, schema):
+    if tables is None:
+        return None
+    # the fixer also needs whatever the planner actually used
+    return tables + [t for t in target_tables if t in schema.tables and t not in tables]
+
+
+def _history_json(state) -> str:
+    if "history_json" not in state:
+        history = state.get("history")
+        state["history_json"] = history.prompt_json() if history is not None else "[]"
+    return state["history_json"]
+
+
+def _context(state) -> QueryContext:
+    return QueryContext(
+        user_query=state["user_query"],
+        now_iso=state["now_iso"],
+        timezone=state["timezone"],
+        history_json=_history_json(state),
+    )
+
+
+def _remember(state):
+    """Append this turn to the session history (in place)."""
+    turn = ConversationTurn(
+        original_question=state["user_query"],
+        rephrased_question=state.get("rephrased", state["user_query"]),
+        final_sql=state.get("validated_sql") or state.get("sql_draft", ""),
+        result_preview=state.get("result_rows", [])[:10],
+        rowcount=state.get("rowcount", 0),
+        timestamp_iso=state["now_iso"],
+        validated=bool(state.get("validated_sql")),
+    )
+    history = state.get("history")
+    if history is None:
+        history = ConversationHistory()
+    history.append(turn)
+    state["history"] = history
+
 
 def build_graph():
     g = StateGraph(AgentState)
 
-    def n1(state: AgentState):
+    async def n1(state: AgentState):
+        out = await rephrase_node(_context(state))
+        state["rephrased"] = out.rephrased_query
+        return state
 
-        ctx = QueryContext(
-            user_query=state["user_query"],
-            now_iso=state["now_iso"],
-            timezone=state["timezone"],
-            previous_turns=state.get("previous_turns", []),
-        )
-        out = rephrase_node(ctx)
+    async def lookup(state: AgentState):
+        state.setdefault("rephrased", state["user_query"])
+        cache = get_answer_cache()
+        if cache is not None:
+            schema = await asyncio.to_thread(get_schema_snapshot)
+            key = answer_key(state["rephrased"], schema.fingerprint, state["now_iso"], state["timezone"])
+            state["answer_key"] = key
+            sql = await cache.aget(key)
+            record_cache("answer", bool(sql))
+            if sql:
+                state["schema"] = schema
+                state["sql_draft"] = sql
+                state["validated_sql"] = sql
+                state["answer_cache_hit"] = True
+        return state
+
+    async def fused(state: AgentState):
+        # the rephrased question is not known yet: retrieve tables for the raw one
+        schema, tables = await asyncio.to_thread(_schema_context, state["user_query"])
+        state["schema"] = schema
+        out = await rephrase_plan_node(_context(state), schema, tables=tables)
         state["rephrased"] = out.rephrased_query
+        state["sql_draft"] = out.sql_draft
+        state["schema_tables"] = _with_targets(tables, out.target_tables, schema)
+        if get_answer_cache() is not None:
+            # no lookup (the draft is already paid for), but later turns can hit what this one validates
+            state["answer_key"] = answer_key(state["rephrased"], schema.fingerprint, state["now_iso"], state["timezone"])
         return state
 
-    def n2(state: AgentState):
-        schema = get_schema_snapshot()
+    async def n2(state: AgentState):
+        schema, tables = await asyncio.to_thread(_schema_context, state["rephrased"])
         state["schema"] = schema
-        plan = plan_sql_node(state["user_query"], state["rephrased"], schema)
-        state["sql_draft"] = plan.sql_draft
+        state["answer_cache_hit"] = state["answer_cache_stale"] = False
+        if settings.plan_candidates > 1:
+            plans = await plan_sql_candidates(
+                state["user_query"], state["rephrased"], schema, tables=tables, n=settings.plan_candidates
+            )
+        else:
+            plans = [await plan_sql_node(state["user_query"], state["rephrased"], schema, tables=tables)]
+        state["sql_draft"] = plans[0].sql_draft
+        state["sql_candidates"] = [p.sql_draft for p in plans]
+        state["schema_tables"] = _with_targets(tables, [t for p in plans for t in p.target_tables], schema)
         return state
 
-    def n3(state: AgentState):
-        val = validate_fix_node(state["sql_draft"], state["schema"])
+    async def n3(state: AgentState):
+        drafts = state.get("sql_candidates") or [state["sql_draft"]]
+        if len(drafts) > 1:
+            val = await validate_candidates_node(
+                drafts, state["schema"], tables=state.get("schema_tables"), select=settings.plan_candidate_select
+            )
+            if val.winner is not None:
+                state["sql_draft"] = drafts[val.winner]
+        else:
+            val = await validate_fix_node(state["sql_draft"], state["schema"], tables=state.get("schema_tables"))
+        record_fix_attempts(val.attempts)
         state["validated_sql"] = val.validated_sql
+        state["cost_estimate"] = val.estimate.model_dump() if val.estimate else None
         if not val.validated_sql:
             state["error"] = val.last_error
+        elif val.result is not None:
+            state["result_rows"] = val.result.rows
+            state["result_set"] = val.result.result_set
+            state["rowcount"] = val.result.rowcount
+            state["executed"] = True
         return state
 
-    def n4(state: AgentState):
+    async def n4(state: AgentState):
         if not state.get("validated_sql"):
             state["result_rows"] = []
             state["rowcount"] = 0
             return state
-        exec_res = run_query_node(state["validated_sql"])
-        state["result_rows"] = exec_res.rows
-        state["rowcount"] = exec_res.rowcount
+        cache = get_answer_cache()
+        if not state.get("executed"):
+            hit = bool(state.get("answer_cache_hit"))
+            try:
+                # cached SQL skipped validate_fix, so it has not been through cost admission yet
+                exec_res = await run_query_node(
+                    state["validated_sql"], known_tables=state["schema"].tables.keys(), admit=hit
+                )
+            except Exception as e:
+                if not hit:
+                    raise
+                if isinstance(e, CostRejected):
+                    # the data grew since the SQL was cached; planning may find a cheaper query
+                    state["cost_estimate"] = e.estimate.model_dump()
+                await cache.ainvalidate(state["answer_key"])
+                state["validated_sql"] = None
+                state["answer_cache_stale"] = True
+                return state
+            state["result_rows"] = exec_res.rows
+            state["result_set"] = exec_res.result_set
+            state["rowcount"] = exec_res.rowcount
+            state["executed"] = True
+            if exec_res.estimate is not None:
+                state["cost_estimate"] = exec_res.estimate.model_dump()
+        if cache is not None and state.get("answer_key") and not state.get("answer_cache_hit"):
+            await cache.aput(state["answer_key"], state["validated_sql"])
         return state
 
-    def n5(state: AgentState):
-        prev = state.get("previous_turns", [])
-        minimal_prev = [
-            {
-                "original_question": t.original_question,
-                "rephrased_question": t.rephrased_question,
-                "final_sql": t.final_sql,
-                "rowcount": t.rowcount,
-                "timestamp_iso": t.timestamp_iso,
-            } for t in prev[-10:]
-        ]
-        text = respond_node(
+    async def n5(state: AgentState):
+        writer = get_stream_writer()
+        text = await respond_node(
             now_iso=state["now_iso"],
             timezone=state["timezone"],
             original_question=state["user_query"],
@@ -82,32 +207,76 @@ def build_graph():
             final_sql=state.get("validated_sql") or state.get("sql_draft", ""),
             result_rows=state.get("result_rows", []),
             rowcount=state.get("rowcount", 0),
-            previous_turns_minimal=minimal_prev,
+            history_json=_history_json(state),
+            result_profile=state.get("result_profile"),
+            on_token=lambda t: writer({"token": t}),
         )
         state["reply_text"] = text
+        _remember(state)
+        return state
 
-        turn = ConversationTurn(
-            original_question=state["user_query"],
-            rephrased_question=state.get("rephrased", state["user_query"]),
-            final_sql=state.get("validated_sql") or state.get("sql_draft", ""),
-            result_preview=state.get("result_rows", [])[:10],
-            rowcount=state.get("rowcount", 0),
-            timestamp_iso=state["now_iso"],
-        )
-        state["previous_turns"] = prev + [turn]
+    async def profile(state: AgentState):
+        rs = state.get("result_set")
+        if rs is None and state.get("result_rows"):
+            rs = ResultSet.from_records(state["result_rows"])
+        state["result_profile"] = profile_result(rs, settings.profile_top_k) if rs is not None and rs.rows else None
         return state
 
-    g.add_node("rephrase", n1)
-    g.add_node("plan_sql", n2)
-    g.add_node("validate_fix", n3)
-    g.add_node("run_query", n4)
-    g.add_node("respond", n5)
+    async def reply(state: AgentState):
+        text = template_reply(state.get("result_rows", []), state.get("rowcount", 0))
+        get_stream_writer()({"token": text})
+        state["reply_text"] = text
+        _remember(state)
+        return state
+
+    def route_entry(state: AgentState):
+        history = state.get("history")
+        if settings.graph_skip_rephrase and not needs_rephrase(state["user_query"], bool(history)):
+            return "answer_cache"
+        return "rephrase_plan" if settings.graph_fuse_rephrase_plan else "rephrase"
+
+    def route_result(state: AgentState):
+        if state.get("answer_cache_stale"):
+            return "plan_sql"
+        if (
+            settings.graph_template_replies
+            and state.get("validated_sql")
+            and template_reply(state.get("result_rows", []), state.get("rowcount", 0)) is not None
+        ):
+            return "reply"
+        return "profile" if settings.respond_profile else "respond"
+
+    g.add_node("rephrase", traced("rephrase", n1))
+    g.add_node("answer_cache", traced("answer_cache", lookup))
+    g.add_node("rephrase_plan", traced("rephrase_plan", fused))
+    g.add_node("plan_sql", traced("plan_sql", n2))
+    g.add_node("validate_fix", traced("validate_fix", n3))
+    g.add_node("run_query", traced("run_query", n4))
+    g.add_node("profile", traced("profile", profile))
+    g.add_node("respond", traced("respond", n5))
+    g.add_node("reply", traced("reply", reply))
 
-    g.set_entry_point("rephrase")
-    g.add_edge("rephrase", "plan_sql")
+    g.add_conditional_edges(
+        START,
+        route_entry,
+        {"rephrase": "rephrase", "answer_cache": "answer_cache", "rephrase_plan": "rephrase_plan"},
+    )
+    g.add_edge("rephrase", "answer_cache")
+    g.add_conditional_edges(
+        "answer_cache",
+        lambda s: "run_query" if s.get("answer_cache_hit") else "plan_sql",
+        {"run_query": "run_query", "plan_sql": "plan_sql"},
+    )
+    g.add_edge("rephrase_plan", "validate_fix")
     g.add_edge("plan_sql", "validate_fix")
     g.add_edge("validate_fix", "run_query")
-    g.add_edge("run_query", "respond")
+    g.add_conditional_edges(
+        "run_query",
+        route_result,
+        {"plan_sql": "plan_sql", "profile": "profile", "respond": "respond", "reply": "reply"},
+    )
+    g.add_edge("profile", "respond")
     g.add_edge("respond", END)
+    g.add_edge("reply", END)
 
     return g.compile()
@@ -0,0 +1,86 @@
+import json
+from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from agent.config import settings
+from agent.llm.tokens import count_tokens
+from agent.types import ConversationTurn
+
+_DIGEST_CHARS = 200
+
+
+def _minimal(t: ConversationTurn) -> dict:
+    return {
+        "original_question": t.original_question,
+        "rephrased_question": t.rephrased_question,
+        "final_sql": t.final_sql,
+        "rowcount": t.rowcount,
+        "timestamp_iso": t.timestamp_iso,
+    }
+
+
+def _digest(t: ConversationTurn) -> str:
+    q = t.rephrased_question or t.original_question
+    if len(q) > _DIGEST_CHARS:
+        q = q[: _DIGEST_CHARS - 1] + "…"
+    outcome = f"{t.rowcount} rows" if t.validated else "no valid SQL"
+    return f"[{t.timestamp_iso}] {q} -> {outcome}"
+
+
+class ConversationHistory(BaseModel):
+    """Recent turns in full plus a one-line digest per older turn.
+
+    Appending past `max_turns` moves the oldest turn into `summary`, which
+    itself keeps at most `max_summary` lines, so a session's history is
+    bounded however long it runs.
+    """
+
+    turns: List[ConversationTurn] = Field(default_factory=list)  # oldest first
+    summary: List[str] = Field(default_factory=list)  # digests of turns that left `turns`, oldest first
+    _rendered: Optional[str] = PrivateAttr(default=None)
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, turn: ConversationTurn):
+        self.turns.append(turn)
+        overflow = len(self.turns) - max(1, settings.history_recent_turns)
+        if overflow > 0:
+            self.summary.extend(_digest(t) for t in self.turns[:overflow])
+            del self.turns[:overflow]
+            if len(self.summary) > settings.history_summary_lines:
+                del self.summary[: len(self.summary) - settings.history_summary_lines]
+        self._rendered = None
+
+    def prompt_json(self, budget: Optional[int] = None, model: Optional[str] = None) -> str:
+        """History section for the rephrase and respond prompts, within `budget` tokens.
+
+        Newest turns are kept in full first; recent turns that do not fit are
+        digested, and digests fill what is left, newest first. The rendering
+        is cached until the next `append`.
+        """
+        if self._rendered is not None and budget is None:
+            return self._rendered
+        limit = settings.history_token_budget if budget is None else budget
+        used = 0
+        full: List[dict] = []
+        for t in reversed(self.turns):
+            entry = _minimal(t)
+            cost = count_tokens(json.dumps(entry, ensure_ascii=False), model)
+            if limit and full and used + cost > limit:
+                break
+            full.append(entry)
+            used += cost
+        earlier: List[str] = []
+        for line in reversed(self.summary + [_digest(t) for t in self.turns[: len(self.turns) - len(full)]]):
+            cost = count_tokens(line, model)
+            if limit and used + cost > limit:
+                break
+            earlier.append(line)
+            used += cost
+        if earlier:
+            out = json.dumps({"earlier": earlier[::-1], "recent_turns": full[::-1]}, ensure_ascii=False)
+        else:
+            out = json.dumps(full[::-1], ensure_ascii=False)
+        if budget is None:
+            self._rendered = out
+        return out
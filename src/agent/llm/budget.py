@@ -0,0 +1,165 @@
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from agent.config import settings
+from agent.llm.prompt_registry import render_prompt
+from agent.llm.tokens import count_tokens
+from agent.metrics import record_prompt
+from agent.schema_cache.index import get_schema_index
+from agent.utils.utility import render_schema_markdown
+
+log = logging.getLogger(__name__)
+
+# (label, section, shrink): shrink() returns a smaller value for `section`, or None once it cannot shrink further
+Step = Tuple[str, str, Callable[[], Optional[str]]]
+
+_overhead: Dict[tuple, int] = {}  # tokens of a template rendered with its text sections empty
+
+
+def prompt_budget(node: str, model: str) -> int:
+    """Max prompt tokens for `node` on `model`: "model:node", then "node", then "model" in
+    PROMPT_TOKEN_BUDGETS, else PROMPT_TOKEN_BUDGET (0 = unlimited)."""
+    budgets = settings.prompt_token_budgets
+    for key in (f"{model}:{node}", node, model):
+        if key in budgets:
+            return budgets[key]
+    return settings.prompt_token_budget
+
+
+def _template_overhead(template: str, values: Dict[str, Any], model: str) -> int:
+    empty = frozenset(k for k, v in values.items() if isinstance(v, str) and not v)
+    key = (template, model, empty)
+    if key not in _overhead:
+        blank = {k: ("" if isinstance(v, str) else v) for k, v in values.items()}
+        _overhead[key] = count_tokens(render_prompt(template, **blank), model)
+    return _overhead[key]
+
+
+def fit_prompt(node: str, template: str, values: Dict[str, Any], steps: Sequence[Step] = (), model: Optional[str] = None) -> str:
+    """Render `template` with `values`, trimmed to the node's token budget.
+
+    Every text section is measured before the call. While the prompt is over
+    budget, `steps` are applied in order, each until the prompt fits or its
+    section cannot shrink further. Trims are logged and counted per node.
+    """
+    model = model or settings.openai_model
+    budget = prompt_budget(node, model)
+    sizes = {k: count_tokens(v, model) for k, v in values.items() if isinstance(v, str)}
+    total = before = _template_overhead(template, values, model) + sum(sizes.values())
+    trims: Dict[str, int] = {}
+    if budget:
+        for label, section, shrink in steps:
+            while total > budget:
+                smaller = shrink()
+                if smaller is None:
+                    break
+                values[section] = smaller
+                new = count_tokens(smaller, model)
+                total += new - sizes[section]
+                sizes[section] = new
+                trims[label] = trims.get(label, 0) + 1
+            if total <= budget:
+                break
+    record_prompt(node, total, trims)
+    if trims:
+        log.info(
+            "prompt %s/%s trimmed %d -> %d tokens (budget %d): %s; sections %s",
+            model, node, before, total, budget, trims, sizes,
+        )
+    if budget and total > budget:
+        log.warning("prompt %s/%s is %d tokens, over its budget of %d after trimming", model, node, total, budget)
+    return render_prompt(template, **values)
+
+
+def _ranked(schema, tables: Optional[List[str]], text: str, pinned: Iterable[str]) -> List[str]:
+    names = list(tables) if tables else list(schema.tables)
+    index = get_schema_index()
+    index.sync(schema)
+    scores = index.score(text or "")
+    pinned = set(pinned)
+    # most relevant first: tables the SQL already uses, then by BM25 score
+    return sorted(names, key=lambda t: (t not in pinned, -scores.get(t, 0.0), t))
+
+
+class SchemaSection:
+    """Schema markdown that can shed sample rows, then its least relevant tables."""
+
+    def __init__(self, values: Dict[str, Any], key: str, schema, tables=None, text: str = "", pinned: Iterable[str] = ()):
+        self.key = key
+        self.schema = schema
+        self.tables = tables
+        self.text = text
+        self.pinned = pinned
+        self.names: Optional[List[str]] = None  # ranked on the first table drop
+        self.samples = True
+        values[key] = self._render()
+
+    def _render(self) -> str:
+        tables = self.names if self.names is not None else self.tables
+        return render_schema_markdown(self.schema, tables=tables, include_samples=self.samples)
+
+    def drop_samples(self) -> Optional[str]:
+        if not self.samples:
+            return None
+        self.samples = False
+        return self._render()
+
+    def drop_table(self) -> Optional[str]:
+        if self.names is None:
+            self.names = _ranked(self.schema, self.tables, self.text, self.pinned)
+        if len(self.names) <= 1:
+            return None
+        log.debug("prompt budget: dropping table %s", self.names.pop())
+        return self._render()
+
+    def steps(self) -> Tuple[Step, Step]:
+        return ("samples", self.key, self.drop_samples), ("tables", self.key, self.drop_table)
+
+
+def history_step(values: Dict[str, Any], key: str = "history_json") -> Step:
+    """Drops the oldest digests (half at a time), then the oldest full turns."""
+    data = json.loads(values.get(key) or "[]")
+    if isinstance(data, dict):
+        earlier, recent = data.get("earlier", []), data.get("recent_turns", [])
+    else:
+        earlier, recent = [], data
+
+    def shrink() -> Optional[str]:
+        if earlier:
+            del earlier[: max(1, len(earlier) // 2)]
+        elif recent:
+            del recent[0]
+        else:
+            return None
+        out = {"earlier": earlier, "recent_turns": recent} if earlier else recent
+        return json.dumps(out, ensure_ascii=False)
+
+    return "history", key, shrink
+
+
+def rows_step(values: Dict[str, Any], rows: List, key: str = "result_preview_json", len_key: str = "preview_len") -> Step:
+    """Halves the sample rows shown to the model, down to none."""
+    kept = list(rows)
+
+    def shrink() -> Optional[str]:
+        if not kept:
+            return None
+        del kept[len(kept) // 2 if len(kept) > 1 else 0:]
+        values[len_key] = len(kept)
+        return json.dumps(kept, ensure_ascii=False, default=str)
+
+    return "samples", key, shrink
+
+
+def profile_step(values: Dict[str, Any], profile: Dict[str, Any], key: str = "profile_json") -> Step:
+    """Drops column profiles from the last column backwards, keeping one."""
+    cols = list(profile.get("columns", []))
+
+    def shrink() -> Optional[str]:
+        if len(cols) <= 1:
+            return None
+        cols.pop()
+        out = {**profile, "columns": cols, "omitted_columns": len(profile["columns"]) - len(cols)}
+        return json.dumps(out, ensure_ascii=False, default=str, separators=(",", ":"))
+
+    return "profile", key, shrink
@@ -1,10 +1,211 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_openai import ChatOpenAI
 from agent.config import settings
+from agent.llm.tokens import count_tokens
+from agent.metrics import current_stage, record_hedge, record_llm
 
-def make_llm(model = None, temperature = 0.1):
-    return ChatOpenAI(
-        model=model or settings.openai_model,
-        temperature=temperature,
-        api_key=settings.openai_api_key,
-        base_url=settings.openai_api_base or None,
+
+class _UsageCallback(BaseCallbackHandler):
+    """Counts prompt/completion tokens and latency of every call, per graph stage."""
+
+    run_inline = True  # stay in the caller's context so the current stage is visible
+
+    def __init__(self):
+        self._pending = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or settings.openai_model
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._pending[run_id] = (model, count_tokens(text, model), time.perf_counter(), current_stage())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        model, prompt_tokens, t0, stage = pending
+        text = "".join(g.text for gens in response.generations for g in gens)
+        record_llm(model, prompt_tokens, count_tokens(text, model), time.perf_counter() - t0, stage=stage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._pending.pop(run_id, None)
+
+
+_usage = _UsageCallback()
+
+
+class _LatencyWindow:
+    """Rolling window of successful call latencies for one model."""
+
+    def __init__(self, size: int = 200):
+        self._values = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._values.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self._values) < min_samples:
+            return None
+        v = sorted(self._values)
+        return v[min(len(v) - 1, int(q * len(v)))]
+
+
+class ManagedLLM:
+    """A shared chat model plus the per-model concurrency limit and request hedging.
+
+    Exposes the `ainvoke` / `astream` / `invoke` surface the nodes use.
+    Retries with jittered exponential backoff on 429/5xx are done by the
+    OpenAI SDK underneath (`max_retries`). With hedging on, an `ainvoke`
+    that has not answered within the model's recent p95 latency is raced
+    against a duplicate request when a concurrency slot is free; the loser
+    is cancelled. Streams are not
+    hedged: tokens may already have been forwarded to the client.
+    """
+
+    def __init__(self, llm, model: str, limit: Optional[asyncio.Semaphore], latency: _LatencyWindow):
+        self.llm = llm
+        self.model = model
+        self._limit = limit
+        self._latency = latency
+
+    async def _call(self, input, config=None, **kwargs):
+        if self._limit is None:
+            t0 = time.perf_counter()
+            out = await self.llm.ainvoke(input, config, **kwargs)
+        else:
+            async with self._limit:
+                t0 = time.perf_counter()
+                out = await self.llm.ainvoke(input, config, **kwargs)
+        self._latency.add(time.perf_counter() - t0)
+        return out
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        delay = None
+        if settings.llm_hedge:
+            delay = self._latency.quantile(settings.llm_hedge_quantile, settings.llm_hedge_min_samples)
+        if delay is None:
+            return await self._call(input, config, **kwargs)
+
+        tasks = [asyncio.ensure_future(self._call(input, config, **kwargs))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # a hedge queued behind the concurrency limit would not answer any sooner
+            if not done and not (self._limit is not None and self._limit.locked()):
+                tasks.append(asyncio.ensure_future(self._call(input, config, **kwargs)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            record_hedge(self.model, won=task is tasks[1])
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def astream(self, input, config=None, **kwargs):
+        if self._limit is None:
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                yield chunk
+            return
+        async with self._limit:
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                yield chunk
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.llm.invoke(input, config, **kwargs)
+
+
+_factory = None
+_lock = threading.Lock()
+_registry: Dict[Tuple[str, float], ManagedLLM] = {}
+_limits: Dict[str, Optional[asyncio.Semaphore]] = {}
+_latency: Dict[str, _LatencyWindow] = {}
+_http: Optional[httpx.Client] = None
+_ahttp: Optional[httpx.AsyncClient] = None
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_keepalive,
+        keepalive_expiry=settings.llm_keepalive_expiry,
     )
+
+
+def _http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """One keep-alive pool per process, shared by every model and base URL."""
+    global _http, _ahttp
+    if _ahttp is None:
+        timeout = httpx.Timeout(settings.llm_timeout, connect=10.0)
+        _http = httpx.Client(limits=_http_limits(), timeout=timeout)
+        _ahttp = httpx.AsyncClient(limits=_http_limits(), timeout=timeout)
+    return _http, _ahttp
+
+
+def _concurrency(model: str) -> Optional[asyncio.Semaphore]:
+    if model not in _limits:
+        n = settings.llm_concurrency_overrides.get(model, settings.llm_max_concurrency)
+        _limits[model] = asyncio.Semaphore(n) if n and n > 0 else None
+    return _limits[model]
+
+
+def set_llm_factory(factory):
+    """Build every LLM with `factory(model=, temperature=, callbacks=)` instead of ChatOpenAI.
+
+    Used by the offline benchmark; pass None to restore the default.
+    """
+    global _factory
+    with _lock:
+        _factory = factory
+        _registry.clear()
+
+
+def make_llm(model = None, temperature = 0.1):
+    """Process-wide model for (model, temperature); built once, then shared."""
+    model = model or settings.openai_model
+    key = (model, float(temperature))
+    llm = _registry.get(key)
+    if llm is not None:
+        return llm
+    with _lock:
+        if key not in _registry:
+            if _factory is not None:
+                inner = _factory(model=model, temperature=temperature, callbacks=[_usage])
+            else:
+                http, ahttp = _http_clients()
+                inner = ChatOpenAI(
+                    model=model,
+                    temperature=temperature,
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_api_base or None,
+                    max_retries=settings.llm_max_retries,
+                    http_client=http,
+                    http_async_client=ahttp,
+                    callbacks=[_usage],
+                )
+            latency = _latency.setdefault(model, _LatencyWindow())
+            _registry[key] = ManagedLLM(inner, model, _concurrency(model), latency)
+        return _registry[key]
+
+
+async def aclose_llm_clients():
+    """Close the shared HTTP pool (app shutdown)."""
+    global _http, _ahttp
+    with _lock:
+        http, ahttp = _http, _ahttp
+        _http = _ahttp = None
+        _registry.clear()
+    if ahttp is not None:
+        await ahttp.aclose()
+    if http is not None:
+        http.close()
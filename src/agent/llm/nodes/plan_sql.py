@@ -1,23 +1,46 @@
-from pathlib import Path
-from langchain_core.prompts import PromptTemplate
+import asyncio
+from typing import List
+from agent.config import settings
+from agent.llm.budget import SchemaSection, fit_prompt
 from agent.llm.client import make_llm
 from agent.types import PlanSQLOutput
-from agent.utils.utility import extract_json, render_schema_markdown
+from agent.utils.utility import extract_json, normalize_sql
 
 
-def plan_sql_node(original_q, rephrased_q, schema):
-    llm = make_llm()
-    prompt_path = Path(__file__).resolve().parents[1] / "prompts" / "plan_sql.md"
-    prompt = PromptTemplate.from_template(
-        prompt_path.read_text(),
-        template_format="jinja2",
-    )
-    schema_md = render_schema_markdown(schema, include_samples=True)
-    msg = prompt.format(
-        user_query=original_q,
-        rephrased_query=rephrased_q,
-        schema_text=schema_md,
-    )
-    resp = llm.invoke(msg)
+def _plan_prompt(original_q, rephrased_q, schema, tables):
+    values = dict(user_query=original_q, rephrased_query=rephrased_q)
+    section = SchemaSection(values, "schema_text", schema, tables, text=rephrased_q)
+    return fit_prompt("plan_sql", "plan_sql", values, section.steps())
+
+
+async def _draft(llm, msg) -> PlanSQLOutput:
+    resp = await llm.ainvoke(msg)
     data = extract_json(getattr(resp, "content", resp))
     return PlanSQLOutput(**data)
+
+
+async def plan_sql_node(original_q, rephrased_q, schema, tables=None):
+    return await _draft(make_llm(), _plan_prompt(original_q, rephrased_q, schema, tables))
+
+
+async def plan_sql_candidates(original_q, rephrased_q, schema, tables=None, n=2) -> List[PlanSQLOutput]:
+    """`n` drafts from concurrent calls; the first at the default temperature, the rest sampled hotter.
+
+    Duplicates (same normalized SQL) and failed calls are dropped.
+    """
+    msg = _plan_prompt(original_q, rephrased_q, schema, tables)
+    hot = make_llm(temperature=settings.plan_candidate_temperature)
+    results = await asyncio.gather(
+        _draft(make_llm(), msg), *(_draft(hot, msg) for _ in range(n - 1)), return_exceptions=True
+    )
+    out, seen = [], set()
+    for r in results:
+        if isinstance(r, BaseException):
+            continue
+        key = normalize_sql(r.sql_draft)
+        if key not in seen:
+            seen.add(key)
+            out.append(r)
+    if not out:
+        raise results[0]
+    return out
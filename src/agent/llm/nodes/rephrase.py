@@ -1,34 +1,19 @@
-from pathlib import Path
-from langchain_core.prompts import PromptTemplate
+from agent.llm.budget import fit_prompt, history_step
 from agent.llm.client import make_llm
 from agent.types import QueryContext, RephraseOutput
 from agent.utils.utility import extract_json
-import json
 
 
-def rephrase_node(ctx: QueryContext) -> RephraseOutput:
+async def rephrase_node(ctx: QueryContext) -> RephraseOutput:
     llm = make_llm()
-    prompt_path = Path(__file__).resolve().parents[1] / "prompts" / "rephrase.md"
-    prompt = PromptTemplate.from_template(
-        prompt_path.read_text(),
-        template_format="jinja2",
-    )
-    minimal_turns = [
-        {
-            "original_question": t.original_question,
-            "rephrased_question": t.rephrased_question,
-            "final_sql": t.final_sql,
-            "rowcount": t.rowcount,
-            "timestamp_iso": t.timestamp_iso,
-        } for t in ctx.previous_turns[-10:]
-    ]
-    msg = prompt.format(
+    values = dict(
         now_iso=ctx.now_iso,
         timezone=ctx.timezone,
         user_query=ctx.user_query,
-        history_json=json.dumps(minimal_turns, ensure_ascii=False, indent=2),
+        history_json=ctx.history_json,
     )
-    resp = llm.invoke(msg)
+    msg = fit_prompt("rephrase", "rephrase", values, [history_step(values)])
+    resp = await llm.ainvoke(msg)
     data = extract_json(getattr(resp, "content", resp))
 
     return RephraseOutput(**data)
@@ -0,0 +1,20 @@
+from agent.llm.budget import SchemaSection, fit_prompt, history_step
+from agent.llm.client import make_llm
+from agent.types import QueryContext, RephrasePlanOutput
+from agent.utils.utility import extract_json
+
+
+async def rephrase_plan_node(ctx: QueryContext, schema, tables=None) -> RephrasePlanOutput:
+    """rephrase + plan_sql in a single LLM round trip."""
+    llm = make_llm()
+    values = dict(
+        now_iso=ctx.now_iso,
+        timezone=ctx.timezone,
+        user_query=ctx.user_query,
+        history_json=ctx.history_json,
+    )
+    samples, drop_tables = SchemaSection(values, "schema_text", schema, tables, text=ctx.user_query).steps()
+    msg = fit_prompt("rephrase_plan", "rephrase_plan", values, [samples, history_step(values), drop_tables])
+    resp = await llm.ainvoke(msg)
+    data = extract_json(getattr(resp, "content", resp))
+    return RephrasePlanOutput(**data)
@@ -1,11 +1,47 @@
-from pathlib import Path
-from typing import List, Dict, Any
-from langchain_core.prompts import PromptTemplate
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+from agent.config import settings
 from agent.llm.client import make_llm
+from agent.llm.budget import fit_prompt, history_step, profile_step, rows_step
+from agent.llm.nodes.run_query import ROW_LIMIT
+from agent.result_profile import representative_rows
 import json
 
 
-def respond_node(
+def _fmt_value(v: Any) -> str:
+    if v is None:
+        return "empty (NULL)"
+    if isinstance(v, bool):
+        return "yes" if v else "no"
+    if isinstance(v, int):
+        return f"{v:,}"
+    if isinstance(v, (float, Decimal)):
+        try:
+            if v == int(v):
+                return f"{v:,.0f}"
+        except (OverflowError, ValueError):  # inf / nan
+            return str(v)
+        return f"{v:,.2f}" if abs(v) >= 0.01 else f"{v:.4g}"
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+def template_reply(result_rows: List[Dict[str, Any]], rowcount: int) -> Optional[str]:
+    """Canned answer for results that need no LLM to explain: no rows, or a single value.
+
+    Returns None when the result deserves a real `respond_node` answer.
+    """
+    if rowcount == 0 and not result_rows:
+        return "No rows matched your question. Try broadening the filters or the time range."
+    if rowcount == 1 and len(result_rows) == 1 and len(result_rows[0]) == 1:
+        (column, value), = result_rows[0].items()
+        return f"The result is {_fmt_value(value)} ({column.replace('_', ' ')})."
+    return None
+
+
+async def respond_node(
     *,
     now_iso: str,
     timezone: str,
@@ -14,25 +50,44 @@ def respond_node(
     final_sql: str,
     result_rows: List[Dict[str, Any]],
     rowcount: int,
-    previous_turns_minimal: List[dict],
+    history_json: str = "[]",
+    result_profile: Optional[Dict[str, Any]] = None,
+    on_token: Optional[Callable[[str], None]] = None,
 ) -> str:
     llm = make_llm(temperature=0.3)
-    prompt_path = Path(__file__).resolve().parents[1] / "prompts" / "respond.md"
-    prompt = PromptTemplate.from_template(prompt_path.read_text(), template_format="jinja2")
 
-    preview_len = min(len(result_rows), 20)
-    preview = result_rows[:preview_len]
+    if result_profile is not None:
+        # the profile covers every row; a few rows show their shape
+        preview = representative_rows(result_rows, settings.respond_sample_rows)
+    else:
+        preview = result_rows[:20]
+    preview_len = len(preview)
 
-    msg = prompt.format(
+    values = dict(
         now_iso=now_iso,
         timezone=timezone,
         original_question=original_question,
         rephrased_question=rephrased_question,
         final_sql=final_sql,
         rowcount=rowcount,
+        truncated=rowcount >= ROW_LIMIT,  # the executor's auto-LIMIT may have cut the result
         preview_len=preview_len,
         result_preview_json=json.dumps(preview, ensure_ascii=False, default=str),
-        history_json=json.dumps(previous_turns_minimal[-10:], ensure_ascii=False),
+        profile_json=json.dumps(result_profile, ensure_ascii=False, default=str, separators=(",", ":")) if result_profile else "",
+        history_json=history_json,
     )
-    resp = llm.invoke(msg)
-    return getattr(resp, "content", str(resp))
+    steps = [rows_step(values, preview), history_step(values)]
+    if result_profile:
+        steps.append(profile_step(values, result_profile))
+    msg = fit_prompt("respond", "respond", values, steps)
+    if on_token is None:
+        resp = await llm.ainvoke(msg)
+        return getattr(resp, "content", str(resp))
+
+    parts = []
+    async for chunk in llm.astream(msg):
+        token = getattr(chunk, "content", "") or ""
+        if token:
+            parts.append(token)
+            on_token(token)
+    return "".join(parts)
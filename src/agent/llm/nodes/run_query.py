@@ -1,6 +1,33 @@
-from agent.db.execute import run_select
+from agent.cache.result_cache import get_result_cache
+from agent.db.cost import CostRejected
+from agent.db.execute import aexplain_estimate, arun_select_result
+from agent.metrics import record_cache, record_cost_decision
 from agent.types import ExecutionResult
 
-def run_query_node(final_sql: str) -> ExecutionResult:
-    rows = run_select(final_sql)
-    return ExecutionResult(final_sql=final_sql, rows=rows, rowcount=len(rows))
+ROW_LIMIT = 100
+
+async def execute_sql(sql: str, known_tables=(), admit: bool = False) -> ExecutionResult:
+    """Run `sql` with the response row limit, through the result cache.
+
+    With `admit`, the plan is estimated first and `CostRejected` is raised
+    instead of executing when it is over the configured cost thresholds.
+    """
+    cache = get_result_cache()
+    if cache is not None:
+        rs = cache.get(sql, ROW_LIMIT)
+        record_cache("result", rs is not None)
+        if rs is not None:
+            return ExecutionResult(final_sql=sql, rows=rs.records(), rowcount=len(rs), cached=True, result_set=rs)
+    estimate = None
+    if admit:
+        estimate = await aexplain_estimate(sql, limit_default=ROW_LIMIT)
+        record_cost_decision(estimate.decision)
+        if estimate.decision != "allow":
+            raise CostRejected(estimate)
+    rs = await arun_select_result(sql, limit_default=ROW_LIMIT)
+    if cache is not None:
+        cache.put(sql, ROW_LIMIT, known_tables, rs)
+    return ExecutionResult(final_sql=sql, rows=rs.records(), rowcount=len(rs), estimate=estimate, result_set=rs)
+
+async def run_query_node(final_sql: str, known_tables=(), admit: bool = False) -> ExecutionResult:
+    return await execute_sql(final_sql, known_tables=known_tables, admit=admit)
@@ -1,9 +1,13 @@
-from pathlib import Path
-from langchain_core.prompts import PromptTemplate
-from agent.db.execute import run_select, explain
+import asyncio
+from agent.db.cost import CostRejected
+from agent.db.execute import aexplain_estimate
+from agent.llm.budget import SchemaSection, fit_prompt
 from agent.llm.client import make_llm
+from agent.llm.nodes.run_query import ROW_LIMIT, execute_sql
+from agent.metrics import record_candidates, record_cost_decision
 from agent.types import SchemaSnapshot, ValidateFixOutput
-from agent.utils.utility import extract_json, render_schema_markdown
+from agent.utils.sql_check import check_sql, format_diagnostics, has_errors
+from agent.utils.utility import extract_json, referenced_tables
 import sqlparse
 
 
@@ -20,36 +24,155 @@ def _pretty_sql(sql):
         return sql
 
 
-def validate_fix_node(sql_draft: str, schema: SchemaSnapshot, max_attempts: int = 3) -> ValidateFixOutput:
+def _with_hints(error, diags):
+    # DB errors are terse; local diagnostics (suspicious joins, unknown names) help the fixer
+    return f"{error}\n{format_diagnostics(diags)}" if diags else error
+
+
+async def _probe(sql: str, schema: SchemaSnapshot):
+    """Validate `sql` by running it: (result, estimate, error).
+
+    A draft is always probed: the local check can be wrong about a name, so
+    its findings only ride along as hints when the database rejects it too.
+    """
+    diags = check_sql(sql, schema)
     try:
-        _ = explain(sql_draft)
-        _ = run_select(sql_draft, limit_default=3)
-        return ValidateFixOutput(validated_sql=_pretty_sql(sql_draft), attempts=1, last_error=None)
+        res = await execute_sql(sql, known_tables=schema.tables.keys(), admit=True)
+        return res, res.estimate, None
+    except CostRejected as e:
+        return None, e.estimate, e.estimate.reason
     except Exception as e:
-        last_err = str(e)
+        return None, None, _with_hints(str(e), diags)
+
+
+def _rejected(estimate) -> bool:
+    return estimate is not None and estimate.decision == "reject"
+
+
+async def validate_fix_node(sql_draft: str, schema: SchemaSnapshot, max_attempts: int = 3, tables=None) -> ValidateFixOutput:
+    # a successful run of the draft is the validation and the final result at once;
+    # the JSON EXPLAIN for admission doubles as the plan-time probe
+    res, estimate, last_err = await _probe(sql_draft, schema)
+    if res is not None:
+        return ValidateFixOutput(validated_sql=_pretty_sql(sql_draft), attempts=1, last_error=None, result=res, estimate=estimate)
+    if _rejected(estimate):
+        return ValidateFixOutput(validated_sql=None, attempts=1, last_error=last_err, estimate=estimate)
+    return await _fix_loop(sql_draft, last_err, estimate, schema, max_attempts, tables)
 
+
+async def _fix_loop(candidate, last_err, estimate, schema, max_attempts, tables, attempts=1) -> ValidateFixOutput:
+    known = schema.tables.keys()
     llm = make_llm()
-    prompt_path = Path(__file__).resolve().parents[1] / "prompts" / "fix_sql.md"
-    prompt = PromptTemplate.from_template(
-        prompt_path.read_text(),
-        template_format="jinja2",
-    )
-    schema_md = render_schema_markdown(schema, include_samples=True)
-
-    attempts = 1
-    candidate = sql_draft
+
     while attempts < max_attempts:
         attempts += 1
-        msg = prompt.format(sql=candidate, error=last_err, schema_text=schema_md, attempts=attempts)
-        resp = llm.invoke(msg)
+        values = dict(sql=candidate, error=last_err, attempts=attempts)
+        # tables the failing SQL uses are the last to go
+        section = SchemaSection(values, "schema_text", schema, tables, text=candidate, pinned=referenced_tables(candidate, known))
+        msg = fit_prompt("fix_sql", "fix_sql", values, section.steps())
+        resp = await llm.ainvoke(msg)
         data = extract_json(getattr(resp, "content", resp))
         fixed = data.get("validated_sql") or data.get("sql") or candidate
+        diags = check_sql(fixed, schema)
+        if has_errors(diags) and attempts < max_attempts:
+            # the database stays the final judge: the last attempt is always probed
+            last_err = format_diagnostics(diags)
+            candidate = fixed
+            continue
         try:
-            _ = explain(fixed)
-            _ = run_select(fixed, limit_default=3)
-            return ValidateFixOutput(validated_sql=_pretty_sql(fixed), attempts=attempts, last_error=None)
+            res = await execute_sql(fixed, known_tables=known, admit=True)
+            return ValidateFixOutput(validated_sql=_pretty_sql(fixed), attempts=attempts, last_error=None, result=res, estimate=res.estimate)
+        except CostRejected as e:
+            estimate = e.estimate
+            if estimate.decision == "reject":
+                return ValidateFixOutput(validated_sql=None, attempts=attempts, last_error=estimate.reason, estimate=estimate)
+            last_err = estimate.reason
+            candidate = fixed
         except Exception as e:
-            last_err = str(e)
+            last_err = _with_hints(str(e), diags)
             candidate = fixed
 
-    return ValidateFixOutput(validated_sql=None, attempts=attempts, last_error=last_err)
+    return ValidateFixOutput(validated_sql=None, attempts=attempts, last_error=last_err, estimate=estimate)
+
+
+async def _first_that_runs(drafts, schema):
+    """Probe every draft at once; the first that runs wins and the others are cancelled."""
+    tasks = {asyncio.ensure_future(_probe(d, schema)): i for i, d in enumerate(drafts)}
+    failures = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.get):
+                res, estimate, err = task.result()
+                if res is not None:
+                    return tasks[task], res, failures
+                failures[tasks[task]] = (err, estimate)
+        return None, None, failures
+    finally:
+        # psycopg sends a cancel request for queries still running on the server; wait for
+        # the losers to unwind so their connections are back in the pool before we return
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+
+
+async def _estimate(sql: str, schema: SchemaSnapshot):
+    diags = check_sql(sql, schema)  # hints only, as in _probe
+    try:
+        estimate = await aexplain_estimate(sql, limit_default=ROW_LIMIT)
+    except Exception as e:
+        return None, _with_hints(str(e), diags)
+    record_cost_decision(estimate.decision)
+    return estimate, None if estimate.decision == "allow" else estimate.reason
+
+
+async def _cheapest_that_runs(drafts, schema):
+    """EXPLAIN every draft at once, then run the admissible ones cheapest first."""
+    estimates = await asyncio.gather(*(_estimate(d, schema) for d in drafts))
+    failures, admitted = {}, []
+    for i, (estimate, err) in enumerate(estimates):
+        if err is None:
+            admitted.append((estimate.total_cost, i, estimate))
+        else:
+            failures[i] = (err, estimate)
+    for _, i, estimate in sorted(admitted):
+        try:
+            res = await execute_sql(drafts[i], known_tables=schema.tables.keys())
+        except Exception as e:
+            failures[i] = (str(e), estimate)
+            continue
+        res.estimate = estimate
+        return i, res, failures
+    return None, None, failures
+
+
+async def validate_candidates_node(drafts, schema: SchemaSnapshot, max_attempts: int = 3, tables=None, select: str = "first") -> ValidateFixOutput:
+    """Validate several drafts for the same question concurrently, over pooled connections.
+
+    `first`: the first draft that runs wins. `cheapest`: the admissible draft
+    with the lowest EXPLAIN cost wins. When none runs, the fix loop continues
+    from the first draft that was not refused outright.
+    """
+    n = len(drafts)
+    if select == "cheapest":
+        winner, res, failures = await _cheapest_that_runs(drafts, schema)
+    else:
+        winner, res, failures = await _first_that_runs(drafts, schema)
+    if res is not None:
+        record_candidates(n, select, str(winner))
+        return ValidateFixOutput(
+            validated_sql=_pretty_sql(drafts[winner]), attempts=1, last_error=None, result=res,
+            estimate=res.estimate, candidates=n, winner=winner,
+        )
+    fixable = [i for i in sorted(failures) if not _rejected(failures[i][1])]
+    if not fixable:
+        record_candidates(n, select, "none")
+        err, estimate = failures[min(failures)]
+        return ValidateFixOutput(validated_sql=None, attempts=1, last_error=err, estimate=estimate, candidates=n)
+    err, estimate = failures[fixable[0]]
+    out = await _fix_loop(drafts[fixable[0]], err, estimate, schema, max_attempts, tables)
+    record_candidates(n, select, "fixed" if out.validated_sql else "none")
+    out.candidates = n
+    return out
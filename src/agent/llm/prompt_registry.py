@@ -0,0 +1,49 @@
+import threading
+from pathlib import Path
+from typing import Dict
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
+
+PROMPTS_DIR = Path(__file__).resolve().parent / "prompts"
+
+
+class PromptRegistry:
+    """Reads and compiles every `prompts/*.md` Jinja2 template once.
+
+    Same sandboxed environment LangChain's jinja2 PromptTemplate uses, but the
+    template is parsed at startup instead of on every format() call.
+    """
+
+    def __init__(self, directory: Path = PROMPTS_DIR):
+        self.directory = directory
+        self._env = SandboxedEnvironment()
+        self._templates: Dict[str, Template] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        compiled = {
+            p.stem: self._env.from_string(p.read_text())
+            for p in sorted(self.directory.glob("*.md"))
+        }
+        with self._lock:
+            self._templates = compiled
+
+    def get(self, name: str) -> Template:
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"Unknown prompt '{name}' (looked in {self.directory})") from None
+
+    def render(self, name: str, **kwargs) -> str:
+        return self.get(name).render(**kwargs)
+
+    def names(self):
+        return sorted(self._templates)
+
+
+prompts = PromptRegistry()
+
+
+def render_prompt(name: str, **kwargs) -> str:
+    return prompts.render(name, **kwargs)
@@ -0,0 +1,42 @@
+import logging
+import threading
+from typing import Dict, Optional
+from agent.config import settings
+
+log = logging.getLogger(__name__)
+
+_encodings: Dict[str, object] = {}  # model -> tiktoken Encoding, or None when it cannot be loaded
+_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    if model in _encodings:
+        return _encodings[model]
+    with _lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    enc = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    # gateways and self-hosted models: any modern BPE is close enough for accounting
+                    enc = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                log.warning("tiktoken encoding for %s unavailable (%s); approximating token counts", model, e)
+                enc = None
+            _encodings[model] = enc
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count of `text` for `model`.
+
+    tiktoken fetches its BPE files on first use; where that is not possible
+    (offline hosts) this falls back to ~4 characters per token.
+    """
+    if not text:
+        return 0
+    enc = _encoding(model or settings.openai_model)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
@@ -1,7 +1,30 @@
+import json
 import logging
+import threading
+from agent.config import settings
 
 def setup_logging(level: str = "INFO"):
     logging.basicConfig(
         level=getattr(logging, level),
         format="%(asctime)s %(levelname)s %(name)s :: %(message)s",
-    )
\ No newline at end of file
+    )
+
+_trace_lock = threading.Lock()
+
+
+def _trace_logger() -> logging.Logger:
+    log = logging.getLogger("agent.trace")
+    if not log.handlers:
+        with _trace_lock:
+            if not log.handlers:
+                handler = logging.FileHandler(settings.trace_log_file) if settings.trace_log_file else logging.StreamHandler()
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                log.addHandler(handler)
+                log.setLevel(logging.INFO)
+                log.propagate = False
+    return log
+
+
+def emit_trace(trace: dict):
+    """One JSON line per request on the `agent.trace` logger."""
+    _trace_logger().info(json.dumps(trace, ensure_ascii=False, default=str))
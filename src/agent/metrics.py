@@ -0,0 +1,226 @@
+import functools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from agent.config import settings
+
+_DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_SECONDS = Histogram("agent_request_seconds", "End-to-end request time", ["endpoint"])
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Time spent per graph stage", ["stage"])
+LLM_SECONDS = Histogram("agent_llm_seconds", "LLM call latency", ["stage", "model"])
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM tokens by stage", ["stage", "model", "kind"])
+DB_SECONDS = Histogram("agent_db_seconds", "Database round-trip time", ["stage", "op"], buckets=_DB_BUCKETS)
+DB_ROUND_TRIPS = Counter("agent_db_round_trips_total", "Database round trips", ["stage", "op"])
+FIX_ATTEMPTS = Histogram("agent_fix_attempts", "Validate/fix attempts per query", buckets=(1, 2, 3, 4, 5, 8))
+CACHE_LOOKUPS = Counter("agent_cache_lookups_total", "Cache lookups", ["cache", "outcome"])
+LLM_HEDGES = Counter("agent_llm_hedges_total", "Hedged LLM requests by which one answered first", ["model", "winner"])
+PLAN_CANDIDATES = Histogram("agent_plan_candidates", "Distinct SQL drafts validated per question", buckets=(1, 2, 3, 4, 5, 8))
+CANDIDATE_WINS = Counter(
+    "agent_plan_candidate_wins_total", "Which draft won candidate validation (index, fixed or none)", ["select", "winner"]
+)
+PROMPT_TOKENS = Histogram(
+    "agent_prompt_tokens", "Prompt size after budgeting", ["node"], buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+)
+PROMPT_TRIMS = Counter("agent_prompt_trims_total", "Prompt sections trimmed to fit the token budget", ["node", "step"])
+DB_ROUTED = Counter("agent_db_routed_total", "Read connections handed out per database backend", ["backend"])
+DB_FAILOVERS = Counter("agent_db_failovers_total", "Reads moved off a backend that could not give a connection", ["backend"])
+DB_REPLICA_LAG = Gauge("agent_db_replica_lag_seconds", "Replay lag of each read replica at its last check", ["backend"])
+COST_DECISIONS = Counter("agent_cost_decisions_total", "EXPLAIN-cost admission decisions", ["decision"])
+
+_stage: ContextVar[str] = ContextVar("agent_stage", default="other")
+
+
+@dataclass
+class RequestTrace:
+    """What one request spent, per stage; logged as a JSON line when tracing is on."""
+
+    endpoint: str
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started: float = field(default_factory=time.perf_counter)
+    seconds: Optional[float] = None  # set when the request finishes
+    spans: List[dict] = field(default_factory=list)
+    llm: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    db: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    cache: Dict[str, str] = field(default_factory=dict)
+    fix_attempts: Optional[int] = None
+    cost_decision: Optional[str] = None
+    candidates: Optional[dict] = None  # {"n", "select", "winner"} when drafts were validated concurrently
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, section: str, stage: str, **values: float):
+        with self._lock:
+            bucket = getattr(self, section).setdefault(stage, {})
+            for k, v in values.items():
+                bucket[k] = bucket.get(k, 0) + v
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "seconds": round(self.seconds if self.seconds is not None else time.perf_counter() - self.started, 6),
+            "spans": self.spans,
+            "llm": self.llm,
+            "db": self.db,
+            "cache": self.cache,
+            "fix_attempts": self.fix_attempts,
+            "cost_decision": self.cost_decision,
+            "candidates": self.candidates,
+        }
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("agent_trace", default=None)
+_listeners: List[Callable[[RequestTrace], None]] = []
+
+
+def add_trace_listener(fn: Callable[[RequestTrace], None]):
+    """Call `fn` with every finished request trace (e.g. the benchmark collecting spans)."""
+    _listeners.append(fn)
+
+
+def remove_trace_listener(fn: Callable[[RequestTrace], None]):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def current_stage() -> str:
+    return _stage.get()
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _trace.get()
+
+
+@contextmanager
+def request_trace(endpoint: str):
+    trace = RequestTrace(endpoint=endpoint)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.seconds = time.perf_counter() - trace.started
+        REQUEST_SECONDS.labels(endpoint).observe(trace.seconds)
+        try:
+            _trace.reset(token)
+        except ValueError:
+            # streamed responses may finish in another context; the trace is done either way
+            pass
+        for fn in list(_listeners):
+            fn(trace)
+        if settings.trace_log:
+            from agent.logging import emit_trace
+            emit_trace(trace.to_dict())
+
+
+@contextmanager
+def span(stage: str):
+    token = _stage.set(stage)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        _stage.reset(token)
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.spans.append({"stage": stage, "start": round(t0 - trace.started, 6), "seconds": round(elapsed, 6)})
+
+
+def traced(stage: str, fn):
+    """Wrap an async graph node in a timing span named `stage`."""
+
+    @functools.wraps(fn)
+    async def run(state):
+        with span(stage):
+            return await fn(state)
+
+    return run
+
+
+def record_llm(model: str, prompt_tokens: int, completion_tokens: int, seconds: float, stage: Optional[str] = None):
+    stage = stage or _stage.get()
+    LLM_SECONDS.labels(stage, model).observe(seconds)
+    LLM_TOKENS.labels(stage, model, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(stage, model, "completion").inc(completion_tokens)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add("llm", stage, calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, seconds=seconds)
+
+
+@contextmanager
+def observe_db(op: str):
+    """Time one database round trip."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        stage = _stage.get()
+        DB_ROUND_TRIPS.labels(stage, op).inc()
+        DB_SECONDS.labels(stage, op).observe(elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add("db", stage, round_trips=1, seconds=elapsed)
+
+
+def record_cache(cache: str, hit: bool):
+    outcome = "hit" if hit else "miss"
+    CACHE_LOOKUPS.labels(cache, outcome).inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace.cache[cache] = outcome
+
+
+def record_fix_attempts(attempts: int):
+    FIX_ATTEMPTS.observe(attempts)
+    trace = _trace.get()
+    if trace is not None:
+        trace.fix_attempts = attempts
+
+
+def record_cost_decision(decision: str):
+    COST_DECISIONS.labels(decision).inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace.cost_decision = decision
+
+
+def record_candidates(n: int, select: str, winner: str):
+    PLAN_CANDIDATES.observe(n)
+    CANDIDATE_WINS.labels(select, winner).inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace.candidates = {"n": n, "select": select, "winner": winner}
+
+
+def record_prompt(node: str, tokens: int, trims: Dict[str, int]):
+    PROMPT_TOKENS.labels(node).observe(tokens)
+    for step, n in trims.items():
+        PROMPT_TRIMS.labels(node, step).inc(n)
+
+
+def record_route(backend: str):
+    DB_ROUTED.labels(backend).inc()
+
+
+def record_failover(backend: str):
+    DB_FAILOVERS.labels(backend).inc()
+
+
+def record_replica_lag(backend: str, lag: float):
+    DB_REPLICA_LAG.labels(backend).set(lag)
+
+
+def record_hedge(model: str, won: bool):
+    LLM_HEDGES.labels(model, "hedge" if won else "primary").inc()
+
+
+def render_metrics():
+    """Prometheus exposition of the process registry: (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,97 @@
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from numbers import Number
+from typing import Any, Dict, List, Sequence
+from agent.types import ResultSet
+
+# money is left out: psycopg returns it as locale-formatted text ("$1,234.50")
+_NUMERIC_TYPES = {"int2", "int4", "int8", "oid", "float4", "float8", "numeric"}
+_TEMPORAL_TYPES = {"date", "timestamp", "timestamptz"}
+_MAX_TEXT = 80  # longer values are cut in the profile
+
+
+def _short(v) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, float):
+        return float(f"{v:.6g}")
+    if isinstance(v, Decimal):
+        return _short(float(v))
+    if isinstance(v, (int, bool)) or v is None:
+        return v
+    s = str(v)
+    return s if len(s) <= _MAX_TEXT else s[: _MAX_TEXT - 1] + "…"
+
+
+def _kind(pg_type: str, values: Sequence) -> str:
+    if pg_type in _NUMERIC_TYPES:
+        return "numeric"
+    if pg_type in _TEMPORAL_TYPES:
+        return "temporal"
+    if pg_type != "unknown":
+        return "categorical"
+    # untyped (e.g. rebuilt from dict rows): decide from the values
+    if values and all(isinstance(v, Number) and not isinstance(v, bool) for v in values):
+        return "numeric"
+    if values and all(isinstance(v, (date, datetime)) for v in values):
+        return "temporal"
+    return "categorical"
+
+
+def _column(name: str, pg_type: str, column: Sequence, top_k: int) -> Dict[str, Any]:
+    values = [v for v in column if v is not None]
+    out: Dict[str, Any] = {"name": name, "type": pg_type, "count": len(values)}
+    if len(values) < len(column):
+        out["nulls"] = len(column) - len(values)
+    if not values:
+        return out
+    kind = _kind(pg_type, values)
+    if kind == "numeric":
+        try:
+            nums = values if all(type(v) is int for v in values) else list(map(float, values))
+        except (TypeError, ValueError):
+            kind = "categorical"  # values the driver did not load as numbers
+        else:
+            total = sum(nums)
+            out.update(min=_short(min(nums)), max=_short(max(nums)), mean=_short(total / len(nums)), sum=_short(total))
+            return out
+    if kind == "temporal":
+        lo, hi = min(values), max(values)
+        out.update(min=_short(lo), max=_short(hi))
+        if isinstance(lo, date) and isinstance(hi, date) and type(lo) is type(hi):
+            out["span_days"] = round((hi - lo).total_seconds() / 86400, 2) if isinstance(lo, datetime) else (hi - lo).days
+        return out
+    try:
+        counts = Counter(values)
+    except TypeError:  # unhashable (json/arrays)
+        counts = Counter(map(str, values))
+    out["distinct"] = len(counts)
+    if len(counts) < len(values):
+        out["top"] = [[_short(v), n] for v, n in counts.most_common(top_k)]
+    else:
+        out["examples"] = [_short(v) for v in values[:3]]  # all different: counts say nothing
+    return out
+
+
+def profile_result(rs: ResultSet, top_k: int = 5) -> Dict[str, Any]:
+    """Per-column statistics over every fetched row, one pass per column.
+
+    Numerics get min/max/mean/sum, dates and timestamps their range, other
+    columns distinct counts and their top-k values.
+    """
+    columns = list(zip(*rs.rows)) if rs.rows else [() for _ in rs.columns]
+    return {
+        "rows": len(rs.rows),
+        "columns": [_column(n, t, c, top_k) for n, t, c in zip(rs.columns, rs.types, columns)],
+    }
+
+
+def representative_rows(rows: List, n: int) -> List:
+    """The first rows (they matter for ordered results) plus the last one, `n` in total."""
+    if len(rows) <= n:
+        return list(rows)
+    if n <= 1:
+        return list(rows[:n])
+    return list(rows[: n - 1]) + [rows[-1]]
+
@@ -0,0 +1,11 @@
+from .cache import SchemaCache, get_schema_cache, get_schema_snapshot
+from .index import SchemaIndex, get_schema_index, select_tables
+
+__all__ = [
+    "SchemaCache",
+    "get_schema_cache",
+    "get_schema_snapshot",
+    "SchemaIndex",
+    "get_schema_index",
+    "select_tables",
+]
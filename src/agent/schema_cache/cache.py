@@ -1,17 +1,173 @@
-import json, os, time
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+from agent.config import settings
 from agent.types import SchemaSnapshot
-from agent.db.introspect import load_schema_snapshot
+from agent.db.introspect import load_schema_snapshot, sample_tables, table_fingerprints
+
+log = logging.getLogger(__name__)
+
+
+def _digest(fps: Dict[str, str]) -> str:
+    h = hashlib.md5()
+    for name in sorted(fps):
+        h.update(f"{name}={fps[name]};".encode())
+    return h.hexdigest()
+
+
+class SchemaCache:
+    """In-memory SchemaSnapshot with change detection.
+
+    Readers always get the current snapshot without I/O. Every
+    `schema_check_interval` seconds a background thread compares per-table
+    catalog fingerprints and re-introspects only the tables that changed;
+    the snapshot is swapped atomically with `version` bumped. Tables left
+    unsampled by the introspection time budget are sampled on later refreshes;
+    those, like periodic resampling, only bump `sample_generation`.
+    Only the very first load (no snapshot in memory nor on disk) blocks the
+    caller.
+    """
+
+    def __init__(self, cache_file: Optional[str] = None):
+        self.cache_file = cache_file
+        self._snap: Optional[SchemaSnapshot] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def get(self) -> SchemaSnapshot:
+        snap = self._snap
+        if snap is None:
+            with self._lock:
+                if self._snap is None:
+                    self._snap = self._warm_start()
+                    if self._snap is None:
+                        self._snap = self._full_load(None)
+                    else:
+                        self._checked_at = 0.0  # verify the disk copy right away
+                snap = self._snap
+        if time.monotonic() - self._checked_at >= settings.schema_check_interval:
+            self._refresh_in_background()
+        return snap
+
+    @property
+    def version(self) -> int:
+        return self._snap.version if self._snap is not None else 0
+
+    def invalidate(self):
+        """Force a fingerprint check on the next get()."""
+        self._checked_at = 0.0
+
+    def _warm_start(self) -> Optional[SchemaSnapshot]:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "r") as f:
+                snap = SchemaSnapshot.model_validate(json.load(f))
+        except Exception as e:
+            log.warning("ignoring unreadable schema cache %s: %s", self.cache_file, e)
+            return None
+        if snap.schema_name != settings.db_schema or not snap.table_fingerprints:
+            return None
+        self._loaded_at = time.monotonic()
+        return snap
+
+    def _full_load(self, cur: Optional[SchemaSnapshot]) -> SchemaSnapshot:
+        snap = load_schema_snapshot()
+        snap.fingerprint = _digest(snap.table_fingerprints)
+        if cur is None:
+            snap.version = 1
+        elif snap.fingerprint == cur.fingerprint:
+            # resampled, no DDL: same version, new samples
+            snap.version, snap.sample_generation = cur.version, cur.sample_generation + 1
+        else:
+            snap.version = cur.version + 1
+        now = time.monotonic()
+        self._checked_at = self._loaded_at = now
+        self._persist(snap)
+        return snap
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            # don't let a burst of requests re-trigger while the thread starts
+            self._checked_at = time.monotonic()
+        threading.Thread(target=self._refresh, name="schema-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            log.exception("schema refresh failed; keeping snapshot v%s", self.version)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self) -> SchemaSnapshot:
+        """Synchronously bring the snapshot up to date; returns the current one."""
+        cur = self._snap
+        if cur is None or time.monotonic() - self._loaded_at >= settings.schema_resample_interval:
+            snap = self._full_load(cur)
+            self._snap = snap
+            return snap
+
+        fps = table_fingerprints()
+        self._checked_at = time.monotonic()
+        old = cur.table_fingerprints
+        changed = [t for t, fp in fps.items() if old.get(t) != fp]
+        dropped = [t for t in old if t not in fps]
+        if not changed and not dropped and not cur.unsampled:
+            return cur
+
+        if changed or dropped:
+            log.info("schema change detected: %d changed/new, %d dropped table(s)", len(changed), len(dropped))
+        partial = load_schema_snapshot(tables=changed) if changed else None
+        tables = {t: v for t, v in cur.tables.items() if t not in dropped and t not in changed}
+        table_fps = {t: fp for t, fp in old.items() if t in tables}
+        retry = [t for t in cur.unsampled if t in tables]
+        if partial is not None:
+            tables.update(partial.tables)
+            table_fps.update(partial.table_fingerprints)
+        snap = SchemaSnapshot(
+            schema=cur.schema_name,
+            # copies: sampling must not mutate tables still shared with the old snapshot
+            tables={t: v.model_copy() if t in retry else v for t, v in tables.items()},
+            # late samples alone are not a schema change
+            version=cur.version + 1 if changed or dropped else cur.version,
+            sample_generation=0 if changed or dropped else cur.sample_generation + 1,
+            fingerprint=_digest(table_fps),
+            table_fingerprints=table_fps,
+        )
+        snap.unsampled = sample_tables(snap, retry) + (partial.unsampled if partial is not None else [])
+        self._snap = snap
+        self._persist(snap)
+        return snap
+
+    def _persist(self, snap: SchemaSnapshot):
+        if not self.cache_file:
+            return
+        tmp = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(snap.model_dump(), f, default=str)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            log.warning("could not write schema cache %s: %s", self.cache_file, e)
+
+
+_cache = SchemaCache(cache_file=settings.schema_cache_file or None)
+
+
+def get_schema_cache() -> SchemaCache:
+    return _cache
 
-CACHE_FILE = ".schema_snapshot.json"
-TTL_SECONDS = 300
 
 def get_schema_snapshot() -> SchemaSnapshot:
-    if os.path.exists(CACHE_FILE):
-        mtime = os.path.getmtime(CACHE_FILE)
-        if (time.time() - mtime) < TTL_SECONDS:
-            with open(CACHE_FILE, "r") as f:
-                return SchemaSnapshot.model_validate(json.load(f))
-    snap = load_schema_snapshot()
-    with open(CACHE_FILE, "w") as f:
-        json.dump(snap.model_dump(), f, indent=2, default=str)
-    return snap
+    return _cache.get()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from agent.config import settings
+from agent.types import SchemaSnapshot, Table
+
+log = logging.getLogger(__name__)
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "how", "in", "is", "it",
+    "me", "many", "much", "of", "on", "or", "show", "than", "that", "the", "to", "was",
+    "were", "what", "which", "who", "with", "list", "give", "all", "per", "each",
+}
+
+# how many times a token is repeated in a table's document, by where it came from
+_W_TABLE, _W_COLUMN, _W_NEIGHBOUR, _W_SAMPLE = 3, 2, 1, 1
+
+
+def tokenize(text: str) -> List[str]:
+    text = _CAMEL.sub(r"\1 \2", str(text)).lower()
+    out = []
+    for w in _WORD.findall(text):
+        if w in _STOP or len(w) < 2:
+            continue
+        # crude singularisation so "orders" matches "order" and "categories" "category"
+        if len(w) > 4 and w.endswith("ies"):
+            w = w[:-3] + "y"
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        out.append(w)
+    return out
+
+
+def _table_terms(t: Table, neighbours: Iterable[str]) -> Counter:
+    tf = Counter()
+    for tok in tokenize(t.name):
+        tf[tok] += _W_TABLE
+    for c in t.columns:
+        for tok in tokenize(c.name):
+            tf[tok] += _W_COLUMN
+    for n in neighbours:
+        for tok in tokenize(n):
+            tf[tok] += _W_NEIGHBOUR
+    for row in t.sample_rows:
+        for v in row.values():
+            if isinstance(v, str) and len(v) <= 64:
+                for tok in tokenize(v):
+                    tf[tok] += _W_SAMPLE
+    return tf
+
+
+def _signature(t: Table, fingerprint: str, neighbours: Set[str]) -> str:
+    h = hashlib.md5(fingerprint.encode())
+    h.update(json.dumps(sorted(neighbours)).encode())
+    h.update(json.dumps(t.sample_rows, default=str, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class _Postings(NamedTuple):
+    """What queries read; replaced as a whole by `sync()`, never changed in place."""
+
+    tf: Dict[str, Counter]
+    lens: Dict[str, int]
+    df: Counter
+    neighbours: Dict[str, Set[str]]
+
+
+class SchemaIndex:
+    """BM25 index over table names, columns, FK neighbours and sample values.
+
+    `sync()` follows the schema cache: only tables whose definition, samples
+    or FK neighbours changed since the last indexed snapshot are re-tokenized.
+    A prebuilt index loaded from disk is reused the same way. Queries read
+    one immutable snapshot, so they never see a half-applied sync.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[tuple] = None
+        self._tables: Dict[str, Table] = {}
+        self._sigs: Dict[str, str] = {}
+        self._data = _Postings({}, {}, Counter(), {})
+
+    def __len__(self):
+        return len(self._data.tf)
+
+    @staticmethod
+    def _fk_graph(snapshot: SchemaSnapshot) -> Dict[str, Set[str]]:
+        graph: Dict[str, Set[str]] = {t: set() for t in snapshot.tables}
+        for t in snapshot.tables.values():
+            for fk in t.foreign_keys:
+                if fk.ref_table in graph and fk.ref_table != t.name:
+                    graph[t.name].add(fk.ref_table)
+                    graph[fk.ref_table].add(t.name)
+        return graph
+
+    def _remove(self, data: _Postings, name: str):
+        for tok in data.tf.pop(name, ()):
+            data.df[tok] -= 1
+            if data.df[tok] <= 0:
+                del data.df[tok]
+        data.lens.pop(name, None)
+        self._tables.pop(name, None)
+        self._sigs.pop(name, None)
+
+    def _add(self, data: _Postings, t: Table, neighbours: Set[str], sig: str):
+        tf = _table_terms(t, neighbours)
+        data.tf[t.name] = tf
+        data.lens[t.name] = sum(tf.values())
+        self._tables[t.name] = t
+        self._sigs[t.name] = sig
+        for tok in tf:
+            data.df[tok] += 1
+
+    def sync(self, snapshot: SchemaSnapshot) -> int:
+        """Bring the index in line with `snapshot`; returns how many tables were (re)indexed."""
+        key = (snapshot.version, snapshot.sample_generation, snapshot.fingerprint)
+        if snapshot.version and key == self._version:
+            return 0
+        with self._lock:
+            if snapshot.version and key == self._version:
+                return 0
+            graph = self._fk_graph(snapshot)
+            old = self._data
+            # copy-on-write: the per-table Counters are replaced, never mutated
+            data = _Postings(dict(old.tf), dict(old.lens), Counter(old.df), graph)
+            changed = 0
+            for name in list(data.tf):
+                if name not in snapshot.tables:
+                    self._remove(data, name)
+            for name, t in snapshot.tables.items():
+                # neighbours are part of the document, so an FK change on either side re-indexes
+                if self._tables.get(name) is t and old.neighbours.get(name) == graph[name]:
+                    continue
+                sig = _signature(t, snapshot.table_fingerprints.get(name, ""), graph[name])
+                if self._sigs.get(name) == sig:
+                    self._tables[name] = t
+                    continue
+                self._remove(data, name)
+                self._add(data, t, graph[name], sig)
+                changed += 1
+            self._data = data
+            self._version = key
+        if changed:
+            log.debug("schema index: re-indexed %d of %d tables", changed, len(snapshot.tables))
+        return changed
+
+    def score(self, query: str) -> Dict[str, float]:
+        data = self._data
+        q = [tok for tok in tokenize(query) if tok in data.df]
+        if not q:
+            return {}
+        n = len(data.tf)
+        avg = (sum(data.lens.values()) / n) if n else 1.0
+        scores: Dict[str, float] = {}
+        for tok in set(q):
+            idf = math.log(1 + (n - data.df[tok] + 0.5) / (data.df[tok] + 0.5))
+            for name, tf in data.tf.items():
+                f = tf.get(tok)
+                if not f:
+                    continue
+                norm = f * (self.k1 + 1) / (f + self.k1 * (1 - self.b + self.b * data.lens[name] / avg))
+                scores[name] = scores.get(name, 0.0) + idf * norm
+        return scores
+
+    def search(self, query: str, top_k: int, fk_hops: int = 1, max_tables: Optional[int] = None) -> List[str]:
+        """Top-k tables for `query`, then their FK neighbourhood up to `max_tables`."""
+        neighbours = self._data.neighbours
+        scores = self.score(query)
+        if not scores:
+            return []
+        ranked = sorted(scores, key=lambda t: (-scores[t], t))[:top_k]
+        chosen = list(ranked)
+        seen = set(chosen)
+        frontier = ranked
+        limit = max_tables or (top_k * 2)
+        for _ in range(max(0, fk_hops)):
+            nxt = []
+            for t in frontier:
+                for nb in sorted(neighbours.get(t, ()), key=lambda x: (-scores.get(x, 0.0), x)):
+                    if nb not in seen:
+                        seen.add(nb)
+                        nxt.append(nb)
+            for nb in nxt:
+                if len(chosen) >= limit:
+                    break
+                chosen.append(nb)
+            frontier = nxt
+        return chosen
+
+    def save(self, path: str):
+        with self._lock:
+            data = {
+                "version": list(self._version or ()),
+                "tf": {t: dict(tf) for t, tf in self._data.tf.items()},
+                "sigs": dict(self._sigs),
+                "neighbours": {t: sorted(n) for t, n in self._data.neighbours.items()},
+            }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str) -> "SchemaIndex":
+        """Load a prebuilt index; sync() then only re-indexes tables that changed since."""
+        with open(path) as f:
+            data = json.load(f)
+        idx = cls()
+        tfs = {t: Counter(tf) for t, tf in data["tf"].items()}
+        df = Counter()
+        for tf in tfs.values():
+            df.update(tf.keys())
+        idx._data = _Postings(
+            tfs, {t: sum(tf.values()) for t, tf in tfs.items()}, df, {t: set(n) for t, n in data["neighbours"].items()}
+        )
+        idx._sigs = dict(data.get("sigs", {}))
+        return idx
+
+
+def _initial_index() -> SchemaIndex:
+    path = settings.schema_index_file
+    if path and os.path.exists(path):
+        try:
+            return SchemaIndex.load(path)
+        except Exception as e:
+            log.warning("ignoring unreadable schema index %s: %s", path, e)
+    return SchemaIndex()
+
+
+_index = _initial_index()
+
+
+def get_schema_index() -> SchemaIndex:
+    return _index
+
+
+def select_tables(snapshot: SchemaSnapshot, question: str) -> Optional[List[str]]:
+    """Tables to show the planner for `question`, or None for the whole schema.
+
+    None is returned when retrieval is disabled, the schema is already small
+    enough, or nothing in the question matched the index.
+    """
+    top_k = settings.schema_retrieval_top_k
+    if top_k <= 0 or len(snapshot.tables) <= settings.schema_retrieval_max_tables:
+        return None
+    _index.sync(snapshot)
+    picked = _index.search(
+        question,
+        top_k=top_k,
+        fk_hops=settings.schema_retrieval_fk_hops,
+        max_tables=settings.schema_retrieval_max_tables,
+    )
+    return picked or None
+
+
+if __name__ == "__main__":
+    # offline build: PYTHONPATH=src python -m agent.schema_cache.index out.json
+    import sys
+    from agent.schema_cache.cache import get_schema_snapshot
+
+    out = sys.argv[1] if len(sys.argv) > 1 else (settings.schema_index_file or "schema_index.json")
+    _index.sync(get_schema_snapshot())
+    _index.save(out)
+    print(f"indexed {len(_index)} tables -> {out}")
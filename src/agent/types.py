@@ -25,6 +25,15 @@ class SchemaSnapshot(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     schema_name: str = Field(alias="schema")
     tables: Dict[str, "Table"]
+    version: int = 0  # bumped by the schema cache on every observed DDL change
+    sample_generation: int = 0  # bumped when only sample rows changed (late or periodic sampling)
+    fingerprint: str = ""  # digest of table_fingerprints; stable across processes
+    table_fingerprints: Dict[str, str] = Field(default_factory=dict)
+    unsampled: List[str] = Field(default_factory=list)  # tables left without samples (time budget)
+
+class SQLDiagnostic(BaseModel):
+    severity: str  # "error" | "warning"
+    message: str
 
 class RephraseOutput(BaseModel):
     rephrased_query: str
@@ -35,15 +44,73 @@ class PlanSQLOutput(BaseModel):
     target_tables: List[str]
     assumptions: str
 
-class ValidateFixOutput(BaseModel):
-    validated_sql: Optional[str]
-    attempts: int
-    last_error: Optional[str]
+class RephrasePlanOutput(BaseModel):
+    rephrased_query: str
+    sql_draft: str
+    target_tables: List[str]
+    assumptions: str = ""
+
+class PlanEstimate(BaseModel):
+    total_cost: float
+    startup_cost: float = 0.0
+    plan_rows: float = 0.0
+    node_type: str = ""
+    decision: str = "allow"  # allow | fix | reject
+    reason: Optional[str] = None
+
+class ResultSet:
+    """A query result as column names and Postgres type names once, plus one tuple per row.
+
+    Built straight from the cursor; `records()` gives the dict-per-row form.
+    """
+
+    __slots__ = ("columns", "types", "rows")
+
+    def __init__(self, columns: List[str], types: List[str], rows: List[tuple]):
+        self.columns = columns
+        self.types = types
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ResultSet":
+        columns = list(records[0].keys()) if records else []
+        return cls(columns, ["unknown"] * len(columns), [tuple(r.values()) for r in records])
+
+    def records(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        cols = self.columns
+        return [dict(zip(cols, r)) for r in self.rows[:limit]]
+
+    def to_payload(self, orient: str = "rows", limit: Optional[int] = None) -> Dict[str, Any]:
+        """JSON-ready columnar form: row arrays (`rows`) or one array per column (`columns`)."""
+        rows = self.rows[:limit]
+        out: Dict[str, Any] = {"columns": self.columns, "types": self.types}
+        if orient == "columns":
+            out["data"] = [list(c) for c in zip(*rows)] if rows else [[] for _ in self.columns]
+        else:
+            out["rows"] = rows
+        return out
 
 class ExecutionResult(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     final_sql: str
     rows: List[Dict[str, Any]]
     rowcount: int
+    cached: bool = False  # served from the result cache without touching the DB
+    estimate: Optional[PlanEstimate] = None
+    result_set: Optional[ResultSet] = Field(default=None, exclude=True)  # same rows, columnar, with column types
+
+class ValidateFixOutput(BaseModel):
+    validated_sql: Optional[str]
+    attempts: int
+    last_error: Optional[str]
+    result: Optional[ExecutionResult] = None  # the successful validation run is the final result
+    estimate: Optional[PlanEstimate] = None  # last plan estimate, also when the query was refused
+    candidates: int = 1  # drafts validated concurrently
+    winner: Optional[int] = None  # index of the draft that ran unchanged (candidate mode)
 
 class ConversationTurn(BaseModel):
     original_question: str
@@ -52,6 +119,7 @@ class ConversationTurn(BaseModel):
     result_preview: List[Dict[str, Any]] = Field(default_factory=list)  # top-N rows only
     rowcount: int
     timestamp_iso: str
+    validated: bool = True  # final_sql passed validate_fix (False: failed draft)
 
 class ResponseOutput(BaseModel):
     reply_text: str
@@ -60,4 +128,4 @@ class QueryContext(BaseModel):
     user_query: str
     now_iso: str
     timezone: str
-    previous_turns: List[ConversationTurn] = Field(default_factory=list)
\ No newline at end of file
+    history_json: str = "[]"  # rendered once per turn by ConversationHistory.prompt_json
\ No newline at end of file
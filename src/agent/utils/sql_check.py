@@ -0,0 +1,262 @@
+import difflib
+from typing import Dict, List, Optional, Tuple
+import sqlparse
+from sqlparse import tokens as T
+from agent.types import SchemaSnapshot, SQLDiagnostic
+
+# keywords after which a FROM-list item is a new relation reference
+_CLAUSE_END = {
+    "WHERE", "GROUP BY", "ORDER BY", "HAVING", "LIMIT", "OFFSET", "UNION", "UNION ALL",
+    "INTERSECT", "EXCEPT", "WINDOW", "ON", "USING", "FETCH", "FOR",
+}
+# schemas whose relations we never know about
+_FOREIGN_SCHEMAS = {"pg_catalog", "information_schema"}
+
+
+def _ident(tok) -> Optional[str]:
+    """Identifier text with Postgres folding, or None if `tok` is not a name."""
+    if tok.ttype in T.Literal.String.Symbol:
+        return tok.value.strip('"')
+    if tok.ttype in T.Name or tok.ttype in T.Keyword:
+        return tok.value.lower()
+    return None
+
+
+def _kw(tok) -> str:
+    return " ".join(tok.value.upper().split()) if tok.is_keyword else ""
+
+
+def _suggest(word: str, options) -> str:
+    options = list(options)
+    w = word.lower()
+    close = [o for o in options if o.lower().startswith(w) or w in o.lower()]
+    close = close or difflib.get_close_matches(word, options, n=1, cutoff=0.6)
+    return f"; did you mean `{close[0]}`?" if close else ""
+
+
+class _Scan:
+    def __init__(self, sql: str):
+        self.toks = [
+            t for t in sqlparse.parse(sql)[0].flatten()
+            if not t.is_whitespace and t.ttype not in T.Comment
+        ] if sql.strip() else []
+        self.ctes = set()
+        self.derived = set()  # aliases of subqueries / set-returning functions
+        self.refs: List[Tuple[Optional[str], str, Optional[str]]] = []  # (schema, table, alias)
+        self.qualified: List[Tuple[int, int, str, str]] = []  # (first token, column token, qualifier, column)
+
+    def _is(self, i, value) -> bool:
+        return i < len(self.toks) and self.toks[i].value == value
+
+    def _skip_parens(self, i) -> int:
+        """`i` at '(' -> index just past the matching ')'."""
+        depth = 0
+        while i < len(self.toks):
+            if self.toks[i].value == "(":
+                depth += 1
+            elif self.toks[i].value == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def _alias(self, i) -> Tuple[Optional[str], int]:
+        explicit = i < len(self.toks) and _kw(self.toks[i]) == "AS"
+        if explicit:
+            i += 1
+        if i < len(self.toks) and (self.toks[i].ttype in T.Name or self.toks[i].ttype in T.Literal.String.Symbol):
+            return _ident(self.toks[i]), i + 1
+        if explicit and i < len(self.toks) and _ident(self.toks[i]) is not None:  # AS final, AS result, ...
+            return _ident(self.toks[i]), i + 1
+        return None, i
+
+    def _cte_names(self, i):
+        """`i` just past WITH: record `name [(cols)] AS [NOT] [MATERIALIZED] (...)` entries.
+
+        The name is taken by position, so CTEs called data, month, result, ...
+        (keywords to sqlparse) count too. Bodies are left for run() to scan.
+        """
+        toks = self.toks
+        if i < len(toks) and toks[i].value.upper() == "RECURSIVE":
+            i += 1
+        while i < len(toks):
+            name = _ident(toks[i])
+            if name is None:
+                return
+            j = i + 1
+            if self._is(j, "("):
+                j = self._skip_parens(j)
+            if j >= len(toks) or _kw(toks[j]) != "AS":
+                return  # not a CTE list, e.g. `timestamp with time zone`
+            j += 1
+            while j < len(toks) and toks[j].value.upper() in ("NOT", "MATERIALIZED"):
+                j += 1
+            if not self._is(j, "(") or j + 1 >= len(toks) or _kw(toks[j + 1]) not in ("SELECT", "WITH", "VALUES"):
+                return
+            self.ctes.add(name)
+            i = self._skip_parens(j)
+            if not self._is(i, ","):
+                return
+            i += 1
+
+    def _relation(self, i) -> int:
+        toks = self.toks
+        if i < len(toks) and _kw(toks[i]) in ("LATERAL", "ONLY"):
+            i += 1
+        if i >= len(toks):
+            return i
+        if toks[i].value == "(":
+            i = self._skip_parens(i)
+            alias, i = self._alias(i)
+            if alias:
+                self.derived.add(alias)
+            return i
+        name = _ident(toks[i])
+        if name is None:
+            return i + 1
+        schema = None
+        i += 1
+        if self._is(i, ".") and i + 1 < len(toks):
+            schema, name = name, _ident(toks[i + 1])
+            i += 2
+        if self._is(i, "("):  # set-returning function, e.g. generate_series(...)
+            i = self._skip_parens(i)
+            alias, i = self._alias(i)
+            if alias:
+                self.derived.add(alias)
+            return i
+        alias, i = self._alias(i)
+        if self._is(i, "("):  # column alias list: AS t(a, b)
+            i = self._skip_parens(i)
+        self.refs.append((schema, name, alias))
+        return i
+
+    def run(self):
+        toks = self.toks
+        # parens opened right before SELECT/WITH are subqueries; FROM inside any other
+        # parens belongs to EXTRACT/SUBSTRING/TRIM and is not a relation list
+        stack: List[bool] = []
+        i = 0
+        while i < len(toks):
+            t = toks[i]
+            kw = _kw(t)
+            if t.value == "(":
+                nxt = toks[i + 1] if i + 1 < len(toks) else None
+                stack.append(bool(nxt is not None and _kw(nxt) in ("SELECT", "WITH")))
+            elif t.value == ")":
+                if stack:
+                    stack.pop()
+            elif (t.ttype in T.Name or t.ttype in T.Literal.String.Symbol) and self._is(i + 1, "."):
+                j = i + 2
+                col = _ident(toks[j]) if j < len(toks) else None
+                # schema.table.column -> qualifier is the table
+                if self._is(j + 1, ".") and j + 2 < len(toks):
+                    qual, col, j = col, _ident(toks[j + 2]), j + 2
+                else:
+                    qual = _ident(t)
+                if col and not self._is(j + 1, "(") and toks[j].value != "*":
+                    self.qualified.append((i, j, qual, col))
+                i = j + 1
+                continue
+            elif kw and (kw == "FROM" or kw.endswith("JOIN")) and (not stack or stack[-1]):
+                i = self._relation(i + 1)
+                if kw == "FROM":
+                    while self._is(i, ","):
+                        i = self._relation(i + 1)
+                continue
+            elif kw == "WITH":
+                self._cte_names(i + 1)
+            i += 1
+        return self
+
+
+def check_sql(sql: str, schema: SchemaSnapshot) -> List[SQLDiagnostic]:
+    """Resolve tables, aliases and qualified columns of `sql` against `schema`.
+
+    Errors are reserved for references that certainly do not exist (unknown
+    table in our schema, unknown column on a resolved table). Joins that do
+    not follow a known foreign key between two related tables are warnings.
+    """
+    try:
+        scan = _Scan(sql or "").run()
+    except Exception:
+        return []
+    tables = {t.lower(): t for t in schema.tables}
+    out: List[SQLDiagnostic] = []
+
+    aliases: Dict[str, Optional[str]] = {}  # alias or bare name -> real table (None: unknown relation)
+    for sch, name, alias in scan.refs:
+        real = None
+        if sch is not None and sch.lower() in _FOREIGN_SCHEMAS:
+            pass
+        elif sch is not None and sch != schema.schema_name and sch.lower() != schema.schema_name.lower():
+            pass
+        elif name in scan.ctes or name in scan.derived:
+            pass
+        elif name.lower() in tables:
+            real = tables[name.lower()]
+        else:
+            out.append(SQLDiagnostic(
+                severity="error",
+                message=f"table `{name}` does not exist in schema {schema.schema_name}{_suggest(name, schema.tables)}",
+            ))
+        aliases[name] = real
+        if alias:
+            aliases[alias] = real
+    for alias in scan.derived | scan.ctes:
+        aliases.setdefault(alias, None)
+
+    resolved: Dict[int, Tuple[int, str, str]] = {}  # first token -> (column token, table, column)
+    for start, end, qual, col in scan.qualified:
+        if qual not in aliases:
+            continue  # schema-qualified function, outer alias we did not see, ...
+        real = aliases[qual]
+        if real is None:
+            continue
+        cols = {c.name.lower(): c.name for c in schema.tables[real].columns}
+        if col.lower() not in cols:
+            shown = f"{schema.schema_name}.{real}" + (f" (alias {qual})" if qual != real else "")
+            out.append(SQLDiagnostic(
+                severity="error",
+                message=f"{shown} has no column `{col}`{_suggest(col, cols.values())}",
+            ))
+            continue
+        resolved[start] = (end, real, cols[col.lower()])
+
+    out.extend(_check_joins(scan, resolved, schema))
+    return out
+
+
+def _check_joins(scan: _Scan, resolved: Dict[int, Tuple[int, str, str]], schema: SchemaSnapshot) -> List[SQLDiagnostic]:
+    fks = {}
+    for t in schema.tables.values():
+        for fk in t.foreign_keys:
+            fks.setdefault(frozenset((fk.table, fk.ref_table)), []).append(fk)
+    out = []
+    # only `a.x = b.y` where both sides resolved to real columns
+    for end, lt, lc in resolved.values():
+        if not scan._is(end + 1, "=") or end + 2 not in resolved:
+            continue
+        _, rt, rc = resolved[end + 2]
+        if lt == rt:
+            continue
+        known = fks.get(frozenset((lt, rt)))
+        if not known:
+            continue
+        if any({(fk.table, fk.column), (fk.ref_table, fk.ref_column)} == {(lt, lc), (rt, rc)} for fk in known):
+            continue
+        hint = ", ".join(f"{fk.table}.{fk.column} = {fk.ref_table}.{fk.ref_column}" for fk in known)
+        out.append(SQLDiagnostic(
+            severity="warning",
+            message=f"join {lt}.{lc} = {rt}.{rc} does not follow a foreign key; known: {hint}",
+        ))
+    return out
+
+
+def has_errors(diags: List[SQLDiagnostic]) -> bool:
+    return any(d.severity == "error" for d in diags)
+
+
+def format_diagnostics(diags: List[SQLDiagnostic]) -> str:
+    return "\n".join(f"{d.severity}: {d.message}" for d in diags)
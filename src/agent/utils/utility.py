@@ -1,15 +1,51 @@
+from collections import OrderedDict
 from datetime import datetime
+import threading
 import pytz
 import json
 import re
+import sqlparse
+from sqlparse import tokens as T
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            val = self._data.get(key)
+            if val is not None:
+                self._data.move_to_end(key)
+            return val
+
+    def put(self, key, val):
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# rendered per-table fragments and whole documents, keyed by snapshot identity
+_table_md_cache = _LRU(8192)
+_schema_md_cache = _LRU(256)
 
 
 def _fmt_table_line(t, include_samples, preview_rows):
+    pk_cols = set(t.primary_key)
+    fk_cols = {fk.column for fk in t.foreign_keys}
     cols = []
     for c in t.columns:
         marks = []
-        if c.name in t.primary_key: marks.append("PK")
-        if any(fk.column == c.name for fk in t.foreign_keys): marks.append("FK")
+        if c.name in pk_cols: marks.append("PK")
+        if c.name in fk_cols: marks.append("FK")
         suffix = f" ({','.join(marks)})" if marks else ""
         nn = "" if c.nullable else " NOT NULL"
         cols.append(f"- {c.name}: {c.data_type}{nn}{suffix}")
@@ -42,11 +78,87 @@ def render_schema_markdown(
     preview_rows = 2,
 ):
     names = set(tables) if tables else set(snapshot.tables.keys())
-    ordered = [snapshot.tables[n] for n in sorted(names) if n in snapshot.tables]
+    # snapshots from the schema cache carry a version; ad-hoc ones are not cached
+    snap_key = (
+        (snapshot.schema_name, snapshot.version, snapshot.sample_generation, snapshot.fingerprint)
+        if snapshot.version
+        else None
+    )
+    doc_key = None
+    if snap_key is not None:
+        doc_key = (snap_key, frozenset(names) if tables else None, include_samples, preview_rows)
+        cached = _schema_md_cache.get(doc_key)
+        if cached is not None:
+            return cached
+
     parts = [f"## Schema: {snapshot.schema_name}", ""]
-    for t in ordered:
-        parts.append(_fmt_table_line(t, include_samples=include_samples, preview_rows=preview_rows))
-    return "\n".join(parts)
+    for n in sorted(names):
+        t = snapshot.tables.get(n)
+        if t is None:
+            continue
+        frag_key = (snap_key, n, include_samples, preview_rows) if snap_key is not None else None
+        frag = _table_md_cache.get(frag_key) if frag_key is not None else None
+        if frag is None:
+            frag = _fmt_table_line(t, include_samples=include_samples, preview_rows=preview_rows)
+            if frag_key is not None:
+                _table_md_cache.put(frag_key, frag)
+        parts.append(frag)
+    text = "\n".join(parts)
+    if doc_key is not None:
+        _schema_md_cache.put(doc_key, text)
+    return text
+
+
+def normalize_sql(sql: str) -> str:
+    """Canonical text for cache keys: no comments, single spaces, upper-case keywords.
+
+    Identifiers and literals are left untouched.
+    """
+    out = []
+    for tok in sqlparse.parse(sql or "")[0].flatten() if (sql or "").strip() else ():
+        if tok.ttype in T.Comment:
+            continue
+        if tok.is_whitespace:
+            if out and out[-1] != " ":
+                out.append(" ")
+            continue
+        out.append(tok.value.upper() if tok.is_keyword else tok.value)
+    return "".join(out).strip().rstrip(";").strip()
+
+
+def referenced_tables(sql: str, known) -> set:
+    """Names in `sql` that match one of the `known` table names (a safe superset)."""
+    known = set(known)
+    found = set()
+    for tok in sqlparse.parse(sql or "")[0].flatten() if (sql or "").strip() else ():
+        if tok.ttype in T.Name or tok.ttype in T.Literal.String.Symbol:
+            name = tok.value.strip('"')
+            if name in known:
+                found.add(name)
+    return found
+
+
+# relative time: the rephrase step pins these to concrete dates
+_RELATIVE_TIME = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|now|currently|current|recent|recently|latest|lately|ago|so far|to date"
+    r"|ytd|mtd|qtd|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+    r"|(this|last|next|past|previous|coming)\s+(\d+\s+)?(hour|day|week|weekend|month|quarter|year)s?)\b",
+    re.I,
+)
+# references that only make sense against the previous turns
+_FOLLOW_UP = re.compile(
+    r"^\s*(and|but|also|what about|how about|same|only|now)\b"
+    r"|\b(it|its|that|those|these|them|they|their|this one|same|again|instead|previous|above"
+    r"|else|other|others|too|as well)\b",
+    re.I,
+)
+
+
+def needs_rephrase(question: str, has_history: bool) -> bool:
+    """Whether the question depends on the current time or, with history, on earlier turns."""
+    if _RELATIVE_TIME.search(question or ""):
+        return True
+    return has_history and (_FOLLOW_UP.search(question or "") is not None or len((question or "").split()) <= 3)
 
 
 def now_iso_tz(tz: str) -> str:
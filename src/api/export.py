@@ -0,0 +1,136 @@
+import csv
+import io
+from decimal import Decimal
+from typing import Dict, Optional
+import orjson
+from fastapi.responses import JSONResponse
+from agent.types import ResultSet
+
+# flush to the client every N rows so memory stays bounded by one chunk
+_CHUNK_ROWS = 500
+
+async def csv_chunks(rows):
+    buf = io.StringIO()
+    writer = None
+    n = 0
+    async for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(row.keys()), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        n += 1
+        if n % _CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+async def ndjson_chunks(rows):
+    parts = []
+    async for row in rows:
+        parts.append(orjson.dumps(row, default=str, option=orjson.OPT_APPEND_NEWLINE))
+        if len(parts) >= _CHUNK_ROWS:
+            yield b"".join(parts)
+            parts = []
+    if parts:
+        yield b"".join(parts)
+
+FORMATS = {
+    "csv": (csv_chunks, "text/csv; charset=utf-8", "csv"),
+    "ndjson": (ndjson_chunks, "application/x-ndjson", "ndjson"),
+}
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: Arrow IPC is offered only when pyarrow is installed
+    pa = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _json_default(o):
+    if isinstance(o, Decimal):
+        # same as FastAPI's encoder: integral -> int, else float
+        exponent = o.as_tuple().exponent
+        return int(o) if isinstance(exponent, int) and exponent >= 0 else float(o)
+    return str(o)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded by orjson; Decimal as a number, other unknown types as strings."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _arrow_type(pg_type: str):
+    if pg_type in ("int2", "int4", "int8", "oid"):
+        return pa.int64()
+    if pg_type in ("float4", "float8", "numeric"):
+        return pa.float64()
+    if pg_type == "bool":
+        return pa.bool_()
+    if pg_type == "date":
+        return pa.date32()
+    if pg_type == "timestamp":
+        return pa.timestamp("us")
+    if pg_type == "timestamptz":
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def _to_str(v):
+    if v is None or isinstance(v, str):
+        return v
+    if isinstance(v, (dict, list)):
+        return orjson.dumps(v, default=str).decode()
+    return str(v)
+
+
+def _arrow_batch(rs: ResultSet, schema):
+    columns = list(zip(*rs.rows)) if rs.rows else [() for _ in rs.columns]
+    arrays = []
+    for values, f in zip(columns, schema):
+        if pa.types.is_floating(f.type):
+            values = [None if v is None else float(v) for v in values]
+        elif pa.types.is_string(f.type):
+            values = [_to_str(v) for v in values]
+        arrays.append(pa.array(values, type=f.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def arrow_schema(rs: ResultSet, metadata: Optional[Dict[str, str]] = None):
+    fields = [pa.field(name, _arrow_type(t)) for name, t in zip(rs.columns, rs.types)]
+    return pa.schema(fields, metadata=metadata)
+
+
+def arrow_ipc(rs: ResultSet, metadata: Optional[Dict[str, str]] = None) -> bytes:
+    """One Arrow IPC stream holding the whole result; `metadata` goes into the schema."""
+    schema = arrow_schema(rs, metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(_arrow_batch(rs, schema))
+    return sink.getvalue().to_pybytes()
+
+
+async def arrow_chunks(batches):
+    """Arrow IPC stream from `ResultSet` batches; bytes are flushed after every batch."""
+    buf = io.BytesIO()
+    writer = schema = None
+    async for rs in batches:
+        if writer is None:
+            schema = arrow_schema(rs)
+            writer = pa.ipc.new_stream(buf, schema)
+        writer.write_batch(_arrow_batch(rs, schema))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if writer is not None:
+        writer.close()
+        yield buf.getvalue()
+
+
+if pa is not None:
+    # takes batches from `aiter_select_batches` instead of dict rows
+    FORMATS["arrow"] = (arrow_chunks, ARROW_MEDIA_TYPE, "arrow")
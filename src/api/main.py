@@ -1,48 +1,64 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from agent.batch import BatchProgress, run_batch
+from agent.cache import get_answer_cache, get_result_cache
 from agent.config import settings
+from agent.db import (
+    aclose_replicas,
+    aiter_select,
+    aiter_select_batches,
+    close_async_pool,
+    close_pool,
+    close_replicas,
+    pool_stats,
+    replica_stats,
+)
+from agent.llm.client import aclose_llm_clients
+from agent.metrics import render_metrics, request_trace
 from agent.utils.utility import now_iso_tz
 from agent.graph import build_graph
-from .models import AskRequest, AskResponse, Message
-from .session import get_or_create_session, read, reset
+from agent.types import ResultSet
+from .export import ARROW_MEDIA_TYPE, FORMATS, ORJSONResponse, arrow_ipc, pa
+from .models import AskBatchRequest, AskRequest, AskResponse, ExportRequest, Message
+from .session import get_or_create_session, get_session_store, load_history, reset, save_history
+
+log = logging.getLogger(__name__)
 
-app = FastAPI(title="SQL Agent API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await aclose_llm_clients()
+    await aclose_replicas()
+    await close_async_pool()
+    close_replicas()
+    close_pool()
+
+app = FastAPI(title="SQL Agent API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
 )
 
 _graph = build_graph()
 
-@app.get("/api/health")
-def health():
-    return {"ok": True}
-
-@app.post("/api/reset")
-def api_reset(req: AskRequest):
-    sid = get_or_create_session(req.session_id)
-    reset(sid)
-    return {"session_id": sid, "ok": True}
-
-@app.post("/api/ask", response_model=AskResponse)
-def api_ask(req: AskRequest):
-    sid = get_or_create_session(req.session_id)
-    sess = read(sid)
-
-    state = {
+def _initial_state(req: AskRequest, history):
+    return {
         "user_query": req.question,
         "now_iso": now_iso_tz(settings.app_timezone),
         "timezone": settings.app_timezone,
-        "previous_turns": sess.get("previous_turns", []),
+        "history": history,
     }
-    final = _graph.invoke(state)
-
-    sess["previous_turns"] = final.get("previous_turns", [])
 
+def _build_response(sid, req: AskRequest, final) -> AskResponse:
     msgs = [
         Message(role="user", text=req.question),
         Message(role="assistant", text=final.get("reply_text") or ""),
     ]
-
     return AskResponse(
         session_id=sid,
         reply_text=final.get("reply_text") or "",
@@ -50,4 +66,216 @@ def api_ask(req: AskRequest):
         rows=(final.get("result_rows") or [])[:100],
         rowcount=final.get("rowcount", 0),
         messages=msgs,
+        cost_estimate=final.get("cost_estimate"),
+    )
+
+def _result_set(final) -> ResultSet:
+    rs = final.get("result_set")
+    return rs if rs is not None else ResultSet.from_records(final.get("result_rows") or [])
+
+def _columnar_response(sid, req: AskRequest, final) -> dict:
+    """AskResponse with `result` (columns, types, rows or data) in place of `rows`; no pydantic pass over the rows."""
+    reply = final.get("reply_text") or ""
+    orient = "columns" if req.result_format == "columns" else "rows"
+    return {
+        "session_id": sid,
+        "reply_text": reply,
+        "final_sql": final.get("validated_sql"),
+        "result": _result_set(final).to_payload(orient, limit=100),
+        "rowcount": final.get("rowcount", 0),
+        "messages": [{"role": "user", "text": req.question}, {"role": "assistant", "text": reply}],
+        "cost_estimate": final.get("cost_estimate"),
+    }
+
+def _arrow_response(sid, final) -> Response:
+    rs = _result_set(final)
+    # the answer travels in the schema metadata next to the rows
+    meta = {
+        "session_id": sid,
+        "reply_text": final.get("reply_text") or "",
+        "final_sql": final.get("validated_sql") or "",
+        "rowcount": str(final.get("rowcount", 0)),
+    }
+    return Response(content=arrow_ipc(ResultSet(rs.columns, rs.types, rs.rows[:100]), meta), media_type=ARROW_MEDIA_TYPE)
+
+def _export_timeout_ms() -> int:
+    ms = settings.export_statement_timeout_ms
+    if ms < 0:
+        return 0  # explicit opt-out: statement_timeout 0 disables it
+    return ms or settings.db_statement_timeout_ms
+
+
+def _require_arrow(fmt: str):
+    if fmt == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output needs pyarrow installed on the server.")
+
+@app.get("/api/health")
+def health():
+    answers, results = get_answer_cache(), get_result_cache()
+    return {
+        "ok": True,
+        "db_pool": pool_stats(),
+        "db_replicas": replica_stats(),
+        "answer_cache": answers.stats() if answers is not None else None,
+        "result_cache": results.stats() if results is not None else None,
+        "sessions": get_session_store().stats(),
+    }
+
+@app.get("/api/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/api/reset")
+def api_reset(req: AskRequest):
+    sid, _ = get_or_create_session(req.session_id)
+    reset(sid)
+    return {"session_id": sid, "ok": True}
+
+@app.post("/api/ask", response_model=AskResponse)
+async def api_ask(req: AskRequest):
+    _require_arrow(req.result_format)
+    # session stores may hit SQLite; keep them off the event loop
+    sid, history = await asyncio.to_thread(get_or_create_session, req.session_id)
+
+    with request_trace("ask"):
+        final = await _graph.ainvoke(_initial_state(req, history))
+
+    await asyncio.to_thread(save_history, sid, final["history"])
+    if req.result_format == "arrow":
+        return _arrow_response(sid, final)
+    if req.result_format != "records":
+        return ORJSONResponse(_columnar_response(sid, req, final))
+    return _build_response(sid, req, final)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+# which state keys each stage contributes to the stream
+_STAGE_FIELDS = {
+    "rephrase": ("rephrased",),
+    "rephrase_plan": ("rephrased", "sql_draft"),
+    "plan_sql": ("sql_draft",),
+    "validate_fix": ("validated_sql", "error", "cost_estimate"),
+    "run_query": ("result_rows", "rowcount"),
+    "profile": ("result_profile",),
+}
+
+@app.post("/api/ask/stream")
+async def api_ask_stream(req: AskRequest):
+    """Server-Sent Events version of /api/ask.
+
+    Emits one event per finished stage (rephrase or rephrase_plan, plan_sql,
+    validate_fix, run_query, profile; skipped stages send nothing), `token`
+    events while the reply is generated and a final `done` event carrying
+    the same payload as /api/ask.
+    """
+    sid, history = await asyncio.to_thread(get_or_create_session, req.session_id)
+    state = _initial_state(req, history)
+
+    async def events():
+        yield _sse("session", {"session_id": sid})
+        final = dict(state)
+        with request_trace("ask_stream"):
+            try:
+                async for mode, chunk in _graph.astream(state, stream_mode=["updates", "custom"]):
+                    if mode == "custom":
+                        if "token" in chunk:
+                            yield _sse("token", {"text": chunk["token"]})
+                        continue
+                    for node, update in chunk.items():
+                        final.update(update or {})
+                        fields = _STAGE_FIELDS.get(node)
+                        if not fields:
+                            continue
+                        payload = {k: final.get(k) for k in fields}
+                        if "result_rows" in payload:
+                            payload["result_rows"] = (payload["result_rows"] or [])[:100]
+                        yield _sse(node, payload)
+            except Exception as e:
+                log.exception("streamed ask failed")
+                yield _sse("error", {"error": str(e)})
+                return
+
+        await asyncio.to_thread(save_history, sid, final["history"])
+        if req.result_format == "records":
+            yield _sse("done", _build_response(sid, req, final).model_dump(mode="json"))
+        else:
+            # Arrow does not fit in an SSE event; it falls back to row arrays
+            yield _sse("done", _columnar_response(sid, req, final))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_batches = {}  # batch id -> BatchProgress, while the batch runs
+
+
+@app.post("/api/ask_batch")
+async def api_ask_batch(req: AskBatchRequest):
+    """Answer many independent questions concurrently, streaming NDJSON.
+
+    One line per question in completion order (with its input `index` and
+    `id`), then a `{"summary": ...}` line. GET /api/batches shows the
+    progress of batches still running; the id is in `X-Batch-Id`.
+    """
+    if len(req.questions) > settings.batch_max_questions:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_questions} questions per batch.")
+    workers = min(req.workers or settings.batch_workers, settings.batch_max_workers)
+    batch_id = uuid.uuid4().hex
+    progress = BatchProgress(total=len(req.questions))
+
+    async def body():
+        _batches[batch_id] = progress
+        try:
+            async for out in run_batch((q.model_dump() for q in req.questions), _graph, workers, progress):
+                yield json.dumps(out, ensure_ascii=False, default=str) + "\n"
+            yield json.dumps({"summary": progress.snapshot()}) + "\n"
+        finally:
+            _batches.pop(batch_id, None)
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+
+@app.get("/api/batches")
+def api_batches():
+    return {batch_id: p.snapshot() for batch_id, p in list(_batches.items())}
+
+
+@app.post("/api/export")
+async def api_export(req: ExportRequest):
+    """Stream the full result of a previously validated answer as CSV or NDJSON.
+
+    Rows come from a server-side cursor in batches, so the export is not
+    capped by the auto-LIMIT applied to /api/ask and memory stays bounded.
+    """
+    turns = (await asyncio.to_thread(load_history, req.session_id)).turns
+    try:
+        turn = turns[req.turn]
+    except IndexError:
+        raise HTTPException(status_code=404, detail="No answer to export for this session/turn.")
+    if not turn.validated or not turn.final_sql:
+        raise HTTPException(status_code=400, detail="That answer has no validated SQL to export.")
+
+    _require_arrow(req.format)
+    encode, media_type, ext = FORMATS[req.format]
+    # Arrow is written per fetched batch from row tuples; csv/ndjson take dict rows
+    source = aiter_select_batches if req.format == "arrow" else aiter_select
+
+    async def body():
+        try:
+            async for chunk in encode(source(turn.final_sql, statement_timeout_ms=_export_timeout_ms())):
+                yield chunk
+        except Exception:
+            # headers are already sent; the truncated body is all we can signal
+            log.exception("export failed for session %s", req.session_id)
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="export.{ext}"'},
     )
@@ -1,10 +1,26 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional, Union
 from pydantic import BaseModel
 
 class AskRequest(BaseModel):
     question: str
     show_sql: bool = False
     session_id: Optional[str] = None
+    # records: `rows` as objects; rows / columns: `result` with column names and types once plus
+    # row arrays / one array per column; arrow: Arrow IPC stream (needs pyarrow on the server)
+    result_format: Literal["records", "rows", "columns", "arrow"] = "records"
+
+class BatchQuestion(BaseModel):
+    question: str
+    id: Optional[Union[str, int]] = None  # echoed back with the answer
+
+class AskBatchRequest(BaseModel):
+    questions: List[BatchQuestion]
+    workers: Optional[int] = None  # default BATCH_WORKERS, capped at BATCH_MAX_WORKERS
+
+class ExportRequest(BaseModel):
+    session_id: str
+    format: Literal["csv", "ndjson", "arrow"] = "csv"
+    turn: int = -1  # index into the session's turns; -1 is the latest answer
 
 class Message(BaseModel):
     role: str
@@ -16,4 +32,5 @@ class AskResponse(BaseModel):
     final_sql: Optional[str] = None
     rows: List[Dict[str, Any]] = []
     rowcount: int = 0
-    messages: List[Message] = []
\ No newline at end of file
+    messages: List[Message] = []
+    cost_estimate: Optional[Dict[str, Any]] = None  # planner cost/rows and the admission decision
\ No newline at end of file
@@ -1,17 +1,180 @@
+import logging
+import sqlite3
+import threading
+import time
 import uuid
-from typing import Dict, Any
+from typing import Dict, Optional, Tuple
+import ormsgpack
+import zstandard
+from agent.cache.ttl import TTLCache
+from agent.config import settings
+from agent.history import ConversationHistory
+from agent.types import ConversationTurn
 
-_sessions: Dict[str, Dict[str, Any]] = {}
+log = logging.getLogger(__name__)
 
-def get_or_create_session(sid):
-    if sid and sid in _sessions:
-        return sid
+# one flag byte, then msgpack; payloads above the threshold are zstd-compressed
+_RAW, _ZSTD = b"\x00", b"\x01"
+_COMPRESS_OVER = 1024
+_zc = threading.local()
+
+
+def _zstd():
+    if not hasattr(_zc, "c"):
+        # (de)compressors are not thread-safe; one pair per thread
+        _zc.c = zstandard.ZstdCompressor(level=3)
+        _zc.d = zstandard.ZstdDecompressor()
+    return _zc.c, _zc.d
+
+
+def encode_history(history: ConversationHistory) -> bytes:
+    packed = ormsgpack.packb(history.model_dump(mode="json"))
+    if len(packed) <= _COMPRESS_OVER:
+        return _RAW + packed
+    return _ZSTD + _zstd()[0].compress(packed)
+
+
+def decode_history(blob: bytes) -> ConversationHistory:
+    flag, body = blob[:1], blob[1:]
+    if flag == _ZSTD:
+        body = _zstd()[1].decompress(body)
+    data = ormsgpack.unpackb(body)
+    if isinstance(data, list):
+        # sessions written before histories were bounded: a plain list of turns
+        history = ConversationHistory()
+        for d in data:
+            history.append(ConversationTurn.model_validate(d))
+        return history
+    return ConversationHistory.model_validate(data)
+
+
+class MemorySessionStore:
+    """Per-process LRU of encoded sessions, bounded by count and bytes, expiring when idle."""
+
+    def __init__(self, maxsize: int = 10000, max_bytes: Optional[int] = None, idle_ttl: Optional[float] = None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=idle_ttl, max_weight=max_bytes, weigh=len)
+
+    def get(self, sid: str) -> Optional[bytes]:
+        return self._cache.get(sid)
+
+    def put(self, sid: str, blob: bytes):
+        self._cache.put(sid, blob)
+
+    def delete(self, sid: str):
+        self._cache.pop(sid)
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SqliteSessionStore:
+    """Sessions in a SQLite file, shared by every worker process on the host."""
+
+    _SWEEP_EVERY = 100  # writes between expiry/size sweeps
+
+    def __init__(self, path: str, maxsize: int = 10000, idle_ttl: Optional[float] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def get(self, sid: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT data, updated_at FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        if self.idle_ttl and row[1] + self.idle_ttl <= time.time():
+            self.delete(sid)
+            return None
+        return row[0]
+
+    def put(self, sid: str, blob: bytes):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, updated_at) VALUES (?, ?, ?)", (sid, blob, now)
+            )
+            self._writes += 1
+            if self._writes % self._SWEEP_EVERY == 0:
+                self._sweep(now)
+
+    def _sweep(self, now: float):
+        if self.idle_ttl:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (now - self.idle_ttl,))
+        self._conn.execute(
+            "DELETE FROM sessions WHERE sid NOT IN (SELECT sid FROM sessions ORDER BY updated_at DESC LIMIT ?)",
+            (self.maxsize,),
+        )
+
+    def delete(self, sid: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            n, size = self._conn.execute("SELECT count(*), coalesce(sum(length(data)), 0) FROM sessions").fetchone()
+        return {"backend": "sqlite", "path": self.path, "size": n, "bytes": size, "maxsize": self.maxsize}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                idle = settings.session_idle_ttl or None
+                if settings.session_backend == "sqlite":
+                    _store = SqliteSessionStore(
+                        settings.session_path or "sessions.sqlite3", maxsize=settings.session_max, idle_ttl=idle
+                    )
+                else:
+                    _store = MemorySessionStore(
+                        maxsize=settings.session_max, max_bytes=settings.session_max_bytes or None, idle_ttl=idle
+                    )
+    return _store
+
+
+def _decode(sid: str, blob: bytes) -> ConversationHistory:
+    try:
+        return decode_history(blob)
+    except Exception as e:
+        log.warning("dropping unreadable session %s: %s", sid, e)
+        return ConversationHistory()
+
+
+def get_or_create_session(sid) -> Tuple[str, ConversationHistory]:
+    """`sid` and its history if the session exists, else a new empty session; one store read."""
+    store = get_session_store()
+    blob = store.get(sid) if sid else None
+    if blob is not None:
+        return sid, _decode(sid, blob)
     new_id = uuid.uuid4().hex
-    _sessions[new_id] = {"previous_turns": []}
-    return new_id
+    history = ConversationHistory()
+    store.put(new_id, encode_history(history))
+    return new_id, history
+
+
+def load_history(sid: str) -> ConversationHistory:
+    blob = get_session_store().get(sid)
+    return ConversationHistory() if blob is None else _decode(sid, blob)
+
+
+def save_history(sid: str, history: ConversationHistory) -> None:
+    get_session_store().put(sid, encode_history(history))
 
-def read(sid: str) -> Dict[str, Any]:
-    return _sessions.setdefault(sid, {"previous_turns": []})
 
 def reset(sid: str) -> None:
-    _sessions[sid] = {"previous_turns": []}
\ No newline at end of file
+    save_history(sid, ConversationHistory())
@@ -0,0 +1,123 @@
+"""Offline benchmark: fake LLM + seeded Postgres fixture, no OpenAI credits.
+
+    PYTHONPATH=src python -m bench run --mode graph --requests 200 --concurrency 16 --out run.json
+    PYTHONPATH=src python -m bench compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# the fake model never calls OpenAI; settings still require a key
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+
+def _run(args):
+    from agent.config import settings
+
+    # the fixture schema, and no caches unless asked: every request pays the full pipeline
+    settings.db_schema = args.schema
+    settings.schema_cache_file = None
+    settings.schema_index_file = None
+    settings.answer_cache_enabled = args.answer_cache
+    settings.answer_cache_path = None
+    settings.result_cache_enabled = args.result_cache
+    settings.trace_log = False
+    settings.graph_fuse_rephrase_plan = args.fuse
+    settings.plan_candidates = args.candidates
+    settings.plan_candidate_select = args.candidate_select
+
+    from agent.db import aclose_replicas, close_async_pool, close_pool, close_replicas
+    from agent.llm.client import set_llm_factory
+    from .fake_llm import fake_llm_factory
+    from .fixture import FixtureShape, ensure_fixture
+    from .run import BenchConfig, run_benchmark, save
+
+    shape = FixtureShape(schema=args.schema, tables=args.tables, columns=args.columns, rows=args.rows)
+    if not args.url:
+        if ensure_fixture(shape, reseed=args.reseed):
+            print(f"seeded {shape.signature()} into schema {shape.schema}", file=sys.stderr)
+        set_llm_factory(fake_llm_factory(shape, args.llm_latency, args.token_latency, args.fix_rate))
+    cfg = BenchConfig(
+        mode=args.mode,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        url=args.url,
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        fix_rate=args.fix_rate,
+        candidates=args.candidates,
+        shape=shape,
+    )
+
+    async def main():
+        try:
+            return await run_benchmark(cfg)
+        finally:
+            await aclose_replicas()
+            await close_async_pool()
+            close_replicas()
+            close_pool()
+
+    result = asyncio.run(main())
+    lat = result["latency"]
+    print(
+        f"{result['ok']}/{result['requests']} ok, {result['rps']:.1f} req/s, "
+        f"p50 {lat.get('p50', 0) * 1000:.1f} ms, p95 {lat.get('p95', 0) * 1000:.1f} ms, "
+        f"p99 {lat.get('p99', 0) * 1000:.1f} ms"
+    )
+    for stage, s in result["stages"].items():
+        print(f"  {stage:<14} p50 {s['p50'] * 1000:8.1f} ms  p95 {s['p95'] * 1000:8.1f} ms  p99 {s['p99'] * 1000:8.1f} ms")
+    if result["candidate_wins"]:
+        print(f"  candidate wins {result['candidate_wins']}")
+    if args.out:
+        save(result, args.out)
+        print(f"saved -> {args.out}")
+
+
+def _compare(args):
+    from .run import compare
+
+    with open(args.a, encoding="utf-8") as fa, open(args.b, encoding="utf-8") as fb:
+        print("\n".join(compare(json.load(fa), json.load(fb))))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="bench", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="run the pipeline against the fixture with the fake LLM")
+    r.add_argument("--mode", choices=("graph", "api"), default="graph")
+    r.add_argument("--url", help="api mode: benchmark a running server instead of the in-process app")
+    r.add_argument("--requests", type=int, default=100)
+    r.add_argument("--concurrency", type=int, default=8)
+    r.add_argument("--warmup", type=int, default=5)
+    r.add_argument("--llm-latency", type=float, default=0.05, help="seconds before each fake LLM reply")
+    r.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed reply chunks")
+    r.add_argument("--fix-rate", type=float, default=0.0, help="fraction of drafts that need the fix loop")
+    r.add_argument("--schema", default="bench")
+    r.add_argument("--tables", type=int, default=10)
+    r.add_argument("--columns", type=int, default=6)
+    r.add_argument("--rows", type=int, default=10000)
+    r.add_argument("--reseed", action="store_true")
+    r.add_argument("--fuse", action="store_true", help="rephrase and plan in one LLM call")
+    r.add_argument("--candidates", type=int, default=1, help="SQL drafts per question, validated concurrently")
+    r.add_argument("--candidate-select", choices=("first", "cheapest"), default="first")
+    r.add_argument("--answer-cache", action="store_true")
+    r.add_argument("--result-cache", action="store_true")
+    r.add_argument("--out", help="write the results as JSON")
+    r.set_defaults(func=_run)
+
+    c = sub.add_parser("compare", help="compare two saved runs")
+    c.add_argument("a")
+    c.add_argument("b")
+    c.set_defaults(func=_compare)
+
+    args = p.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from .fixture import FixtureShape, needs_fix, sql_for
+
+_BROKEN = "_bogus"  # appended to a column name to send a draft through the fix loop
+_FIELD = {
+    "user_question": re.compile(r'^User question: "(.*)"\s*$', re.M),
+    "rephrased": re.compile(r"^Rephrased: (.*)$", re.M),
+    "rowcount": re.compile(r"^- rowcount: (\d+)", re.M),
+}
+_FIX_SQL = re.compile(r"^SQL:\n(.*?)\nError:", re.M | re.S)
+
+
+def _field(prompt: str, name: str, default: str = "") -> str:
+    m = _FIELD[name].search(prompt)
+    return m.group(1) if m else default
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI that replays canned answers for the fixture schema.
+
+    The prompt kind (rephrase / plan / rephrase+plan / fix / respond) is recognised from the
+    rendered template; `latency` is paid before the first token and
+    `token_latency` between streamed chunks.
+    """
+
+    shape: FixtureShape
+    model_name: str = "bench-fake"
+    latency: float = 0.0
+    token_latency: float = 0.0
+    fix_rate: float = 0.0  # fraction of questions whose first draft is broken
+    temperature: float = 0.0  # at 0.5 and above, SQL drafts are varied and broken at random
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model_name}
+
+    def _draft(self, q: str) -> str:
+        sql = sql_for(q, self.shape)
+        if self.temperature >= 0.5:
+            # sampled candidates: an equivalent rewrite, broken independently of the greedy draft
+            sql = f"SELECT * FROM ({sql}) AS candidate"
+            broken = random.random() < self.fix_rate
+        else:
+            broken = needs_fix(q, self.fix_rate)
+        if broken:
+            sql = sql.replace("x1", "x1" + _BROKEN, 1).replace("n0", "n0" + _BROKEN, 1)
+        return sql
+
+    def reply(self, prompt: str) -> str:
+        if "normalizes user questions" in prompt:
+            q = _field(prompt, "user_question")
+            return json.dumps({"rephrased_query": q, "reasoning": "canned"})
+        if "and write a first SQL draft" in prompt:
+            q = _field(prompt, "user_question")
+            return json.dumps({"rephrased_query": q, "sql_draft": self._draft(q), "target_tables": [], "assumptions": "canned"})
+        if "first SQL draft" in prompt:
+            q = _field(prompt, "rephrased")
+            return json.dumps({"sql_draft": self._draft(q), "target_tables": [], "assumptions": "canned"})
+        if "fixing a Postgres SQL query" in prompt:
+            m = _FIX_SQL.search(prompt)
+            sql = (m.group(1) if m else "").replace(_BROKEN, "")
+            return json.dumps({"validated_sql": sql})
+        rows = _field(prompt, "rowcount", "0")
+        return f"The query returned {rows} rows. This is a canned answer from the benchmark model."
+
+    @staticmethod
+    def _prompt(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _result(self, text: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(self.reply(self._prompt(messages)))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(self.reply(self._prompt(messages)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.reply(self._prompt(messages))
+        await asyncio.sleep(self.latency)
+        for i, piece in enumerate(re.findall(r"\S+\s*", text)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def fake_llm_factory(shape: FixtureShape, latency: float = 0.0, token_latency: float = 0.0, fix_rate: float = 0.0):
+    """A `set_llm_factory` callable producing `FakeChatModel`s."""
+
+    def factory(model: Optional[str] = None, temperature: float = 0.1, callbacks=None):
+        return FakeChatModel(
+            shape=shape,
+            model_name=model or "bench-fake",
+            latency=latency,
+            token_latency=token_latency,
+            fix_rate=fix_rate,
+            temperature=temperature,
+            callbacks=callbacks,
+        )
+
+    return factory
@@ -0,0 +1,140 @@
+import hashlib
+import re
+from dataclasses import asdict, dataclass
+from typing import List
+import psycopg2
+from psycopg2 import sql
+from agent.db.pool import conninfo
+
+_CATEGORIES = 20
+_TABLE_RE = re.compile(r"\bt(\d+)\b")
+
+
+@dataclass(frozen=True)
+class FixtureShape:
+    schema: str = "bench"
+    tables: int = 10
+    columns: int = 6  # value columns per table, besides id / parent_id / created_at (min 3)
+    rows: int = 10000
+
+    def signature(self) -> str:
+        return f"bench-fixture tables={self.tables} columns={self.columns} rows={self.rows}"
+
+    def value_columns(self) -> List[tuple]:
+        # n* integers, x* numerics, s* low-cardinality text; n0, x1 and s2 always exist
+        kinds = ("n", "x", "s")
+        return [(f"{kinds[j % 3]}{j}", kinds[j % 3]) for j in range(max(3, self.columns))]
+
+
+_TYPES = {"n": "integer", "x": "numeric(12,2)", "s": "text"}
+_VALUES = {
+    "n": "((g * 7919 + {j}) % 1000)",
+    "x": "(((g * 31 + {j}) % 100000) / 100.0)",
+    "s": "'cat' || ((g + {j}) % " + str(_CATEGORIES) + ")",
+}
+
+
+def _table(shape: FixtureShape, i: int) -> sql.Composed:
+    return sql.SQL("{}.{}").format(sql.Identifier(shape.schema), sql.Identifier(f"t{i}"))
+
+
+def _ddl(shape: FixtureShape, i: int) -> sql.Composed:
+    cols = [sql.SQL("id bigint PRIMARY KEY")]
+    if i > 0:
+        cols.append(sql.SQL("parent_id bigint REFERENCES {}(id)").format(_table(shape, i - 1)))
+    cols.append(sql.SQL("created_at timestamptz NOT NULL"))
+    cols += [sql.SQL("{} " + _TYPES[kind]).format(sql.Identifier(name)) for name, kind in shape.value_columns()]
+    return sql.SQL("CREATE TABLE {} ({})").format(_table(shape, i), sql.SQL(", ").join(cols))
+
+
+def _fill(shape: FixtureShape, i: int) -> sql.Composed:
+    exprs = ["g"]
+    if i > 0:
+        exprs.append(f"(g % {int(shape.rows)}) + 1")
+    exprs.append("now() - g * interval '1 minute'")
+    exprs += [_VALUES[kind].format(j=j) for j, (_, kind) in enumerate(shape.value_columns())]
+    return sql.SQL("INSERT INTO {} SELECT " + ", ".join(exprs) + f" FROM generate_series(1, {int(shape.rows)}) g").format(_table(shape, i))
+
+
+def ensure_fixture(shape: FixtureShape, reseed: bool = False) -> bool:
+    """Create and fill the fixture schema unless it already matches `shape`. True if (re)seeded."""
+    conn = psycopg2.connect(**conninfo())
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace WHERE nspname = %s",
+                (shape.schema,),
+            )
+            row = cur.fetchone()
+            if row and row[0] == shape.signature() and not reseed:
+                return False
+            if row and not (row[0] or "").startswith("bench-fixture"):
+                # never drop a schema the benchmark did not create
+                raise RuntimeError(
+                    f"schema {shape.schema!r} exists and is not a bench fixture; pick another --schema"
+                )
+            schema = sql.Identifier(shape.schema)
+            cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(schema))
+            cur.execute(sql.SQL("CREATE SCHEMA {}").format(schema))
+            for i in range(shape.tables):
+                cur.execute(_ddl(shape, i))
+                cur.execute(_fill(shape, i))
+                if i > 0:
+                    cur.execute(sql.SQL("CREATE INDEX ON {} (parent_id)").format(_table(shape, i)))
+                cur.execute(sql.SQL("ANALYZE {}").format(_table(shape, i)))
+            cur.execute(sql.SQL("COMMENT ON SCHEMA {} IS %s").format(schema), (shape.signature(),))
+        return True
+    finally:
+        conn.close()
+
+
+def _pick(question: str, n: int) -> int:
+    return int(hashlib.sha1(question.encode()).hexdigest()[:8], 16) % n
+
+
+def questions(shape: FixtureShape, n: int) -> List[str]:
+    """`n` deterministic questions cycling over the fixture tables and query shapes."""
+    out = []
+    for k in range(n):
+        i = k % shape.tables
+        kind = (k // shape.tables) % 4
+        if kind == 0:
+            q = f"How many rows are in t{i}?"
+        elif kind == 1:
+            q = f"What is the average x1 per s2 in t{i}?"
+        elif kind == 2:
+            q = f"Top 10 rows of t{i} by n0 created in the last 30 days"
+        else:
+            q = f"Total x1 of t{i} per parent s2" if i > 0 else f"How many distinct s2 values are in t{i}?"
+        out.append(f"{q} (#{k})")
+    return out
+
+
+def sql_for(question: str, shape: FixtureShape) -> str:
+    """The SQL the fake planner answers with for a question from `questions`."""
+    s = shape.schema
+    i = int(_TABLE_RE.search(question).group(1))
+    if question.startswith("How many rows"):
+        return f"SELECT count(*) AS n FROM {s}.t{i}"
+    if question.startswith("What is the average"):
+        return f"SELECT s2, avg(x1) AS avg_x1 FROM {s}.t{i} GROUP BY s2 ORDER BY s2"
+    if question.startswith("Top 10"):
+        return (
+            f"SELECT id, n0, created_at FROM {s}.t{i} "
+            f"WHERE created_at >= now() - interval '30 days' ORDER BY n0 DESC LIMIT 10"
+        )
+    if question.startswith("Total x1"):
+        return (
+            f"SELECT p.s2, sum(c.x1) AS total_x1 FROM {s}.t{i} c "
+            f"JOIN {s}.t{i - 1} p ON p.id = c.parent_id GROUP BY p.s2 ORDER BY p.s2"
+        )
+    return f"SELECT count(DISTINCT s2) AS n FROM {s}.t{i}"
+
+
+def needs_fix(question: str, fix_rate: float) -> bool:
+    return fix_rate > 0 and _pick(question, 10000) < fix_rate * 10000
+
+
+def describe(shape: FixtureShape) -> dict:
+    return asdict(shape)
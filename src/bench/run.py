@@ -0,0 +1,257 @@
+import asyncio
+import json
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+import psycopg2
+from agent.config import settings
+from agent.db.pool import conninfo, pool_stats
+from agent.db.replicas import replica_stats
+from agent.history import ConversationHistory
+from agent.metrics import RequestTrace, add_trace_listener, remove_trace_listener, request_trace
+from agent.utils.utility import now_iso_tz
+from .fixture import FixtureShape, questions
+
+
+@dataclass
+class BenchConfig:
+    mode: str = "graph"  # graph | api
+    requests: int = 100
+    concurrency: int = 8
+    warmup: int = 5
+    url: Optional[str] = None  # api mode against a running server instead of in-process
+    llm_latency: float = 0.0
+    token_latency: float = 0.0
+    fix_rate: float = 0.0
+    candidates: int = 1
+    shape: FixtureShape = field(default_factory=FixtureShape)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+
+    def pct(p):
+        # nearest rank
+        return v[min(len(v) - 1, max(0, int(round(p / 100 * len(v))) - 1))]
+
+    return {
+        "n": len(v),
+        "mean": sum(v) / len(v),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": v[-1],
+    }
+
+
+class _ConnectionSampler:
+    """Samples client pool sizes and server-side backends while the benchmark runs."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.samples: List[dict] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="bench-conn-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.summary()
+
+    def _run(self):
+        conn = psycopg2.connect(**conninfo())
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self._stop.wait(self.interval):
+                    cur.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND backend_type = 'client backend' "
+                        "AND pid <> pg_backend_pid()"
+                    )
+                    stats = pool_stats()
+                    self.samples.append({
+                        "server_backends": cur.fetchone()[0],
+                        "sync_size": stats["sync"].get("size", 0),
+                        "sync_in_use": stats["sync"].get("in_use", 0),
+                        "async_size": stats["async"].get("pool_size", 0),
+                        "async_in_use": stats["async"].get("pool_size", 0) - stats["async"].get("pool_available", 0),
+                        "async_waiting": stats["async"].get("requests_waiting", 0),
+                    })
+        finally:
+            conn.close()
+
+    def summary(self) -> dict:
+        out = {"samples": len(self.samples)}
+        for key in ("server_backends", "sync_size", "sync_in_use", "async_size", "async_in_use", "async_waiting"):
+            vals = [s[key] for s in self.samples]
+            out[key] = {"max": max(vals, default=0), "mean": (sum(vals) / len(vals)) if vals else 0.0}
+        out["pools"] = pool_stats()
+        out["replicas"] = replica_stats()
+        return out
+
+
+def _graph_state(question: str) -> dict:
+    return {
+        "user_query": question,
+        "now_iso": now_iso_tz(settings.app_timezone),
+        "timezone": settings.app_timezone,
+        "history": ConversationHistory(),
+    }
+
+
+async def _drive(cfg: BenchConfig, qs: List[str], traces: List[RequestTrace]):
+    """Send `qs` at `cfg.concurrency`; returns (latencies, errors)."""
+    latencies: List[float] = []
+    errors: List[str] = []
+    sem = asyncio.Semaphore(cfg.concurrency)
+
+    if cfg.mode == "graph":
+        from agent.graph import build_graph
+        graph = build_graph()
+
+        async def one(q):
+            with request_trace("bench") as trace:
+                await graph.ainvoke(_graph_state(q))
+            traces.append(trace)
+        client = None
+    else:
+        if cfg.url:
+            client = httpx.AsyncClient(base_url=cfg.url, timeout=120)
+        else:
+            from api.main import app
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+
+        async def one(q):
+            r = await client.post("/api/ask", json={"question": q})
+            r.raise_for_status()
+
+    async def timed(q):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await one(q)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - t0)
+
+    try:
+        await asyncio.gather(*(timed(q) for q in qs))
+    finally:
+        if client is not None:
+            await client.aclose()
+    return latencies, errors
+
+
+def _summarise_traces(traces: List[RequestTrace]) -> dict:
+    stages: Dict[str, List[float]] = {}
+    llm: Dict[str, Dict[str, float]] = {}
+    db = {"round_trips": 0, "seconds": 0.0}
+    fix_attempts: List[float] = []
+    cache: Dict[str, Dict[str, int]] = {}
+    wins: Dict[str, int] = {}
+    for t in traces:
+        for s in t.spans:
+            stages.setdefault(s["stage"], []).append(s["seconds"])
+        for stage, vals in t.llm.items():
+            agg = llm.setdefault(stage, {})
+            for k, v in vals.items():
+                agg[k] = agg.get(k, 0) + v
+        for vals in t.db.values():
+            db["round_trips"] += vals.get("round_trips", 0)
+            db["seconds"] += vals.get("seconds", 0.0)
+        if t.fix_attempts is not None:
+            fix_attempts.append(t.fix_attempts)
+        for name, outcome in t.cache.items():
+            c = cache.setdefault(name, {})
+            c[outcome] = c.get(outcome, 0) + 1
+        if t.candidates is not None:
+            wins[t.candidates["winner"]] = wins.get(t.candidates["winner"], 0) + 1
+    n = max(1, len(traces))
+    return {
+        "stages": {k: percentiles(v) for k, v in stages.items()},
+        "llm": llm,
+        "db": {**db, "round_trips_per_request": db["round_trips"] / n},
+        "fix_attempts": percentiles(fix_attempts),
+        "cache": cache,
+        "candidate_wins": wins,
+    }
+
+
+async def run_benchmark(cfg: BenchConfig) -> dict:
+    qs = questions(cfg.shape, cfg.warmup + cfg.requests)
+    warm, measured = qs[: cfg.warmup], qs[cfg.warmup:]
+    traces: List[RequestTrace] = []
+    listener = None
+    if cfg.mode == "api" and not cfg.url:
+        listener = traces.append
+        add_trace_listener(listener)
+    try:
+        if warm:
+            # first requests pay for schema introspection and pool warm-up
+            await _drive(cfg, warm, [])
+            traces.clear()
+        sampler = None if cfg.url else _ConnectionSampler()
+        if sampler:
+            sampler.start()
+        t0 = time.perf_counter()
+        latencies, errors = await _drive(cfg, measured, traces)
+        wall = time.perf_counter() - t0
+        connections = sampler.stop() if sampler else None
+    finally:
+        if listener is not None:
+            remove_trace_listener(listener)
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": asdict(cfg),
+        "requests": len(measured),
+        "ok": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_seconds": wall,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "latency": percentiles(latencies),
+        **_summarise_traces(traces),
+        "connections": connections,
+    }
+
+
+def save(result: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, default=str)
+
+
+def compare(a: dict, b: dict) -> List[str]:
+    """Side-by-side latency/throughput lines for two saved runs (b relative to a)."""
+
+    def delta(x, y):
+        return f"{(y - x) / x * 100:+.1f}%" if x else "n/a"
+
+    lines = [f"{'metric':<28}{'A':>12}{'B':>12}{'delta':>10}"]
+    lines.append(f"{'rps':<28}{a['rps']:>12.2f}{b['rps']:>12.2f}{delta(a['rps'], b['rps']):>10}")
+    rows = [("total", a["latency"], b["latency"])]
+    for stage in a.get("stages", {}):
+        if stage in b.get("stages", {}):
+            rows.append((stage, a["stages"][stage], b["stages"][stage]))
+    for name, sa, sb in rows:
+        for p in ("p50", "p95", "p99"):
+            if p in sa and p in sb:
+                lines.append(
+                    f"{name + ' ' + p + ' (ms)':<28}{sa[p] * 1000:>12.1f}{sb[p] * 1000:>12.1f}{delta(sa[p], sb[p]):>10}"
+                )
+    return lines
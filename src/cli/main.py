@@ -1,15 +1,76 @@
+import argparse
+import asyncio
 import json
+import sys
+import time
 from agent.logging import setup_logging
 from agent.config import settings
 from agent.utils.utility import now_iso_tz
 from agent.graph import build_graph
+from agent.history import ConversationHistory
+from agent.llm.client import aclose_llm_clients
+from agent.db import aclose_replicas, close_async_pool, close_pool, close_replicas
+from agent.metrics import request_trace
+from agent.batch import BatchProgress, read_jsonl, run_batch
 
-def main():
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="SQL Agent CLI: interactive by default, or `batch` for a JSONL file.")
+    sub = p.add_subparsers(dest="cmd")
+    b = sub.add_parser("batch", help="answer every question of a JSONL file concurrently")
+    b.add_argument("input", help='one {"question": ..., "id": ...} per line')
+    b.add_argument("--out", default="-", help="JSONL results, in completion order (default: stdout)")
+    b.add_argument("--workers", type=int, default=settings.batch_workers)
+    b.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines on stderr")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
     setup_logging()
     graph = build_graph()
+    # one event loop for the whole session so the async DB pool survives between questions
+    with asyncio.Runner() as runner:
+        try:
+            if args.cmd == "batch":
+                runner.run(_batch(graph, args))
+            else:
+                _repl(graph, runner)
+        finally:
+            runner.run(aclose_llm_clients())
+            runner.run(aclose_replicas())
+            runner.run(close_async_pool())
+            close_replicas()
+            close_pool()
+
+async def _ask(graph, state):
+    with request_trace("cli"):
+        return await graph.ainvoke(state)
+
+def _progress_line(p):
+    total = p["total"] if p["total"] is not None else "?"
+    eta = f", eta {p['eta_seconds']:.0f}s" if p["eta_seconds"] is not None else ""
+    return f"{p['done']}/{total} done, {p['failed']} failed, {p['per_second']:.2f}/s{eta}"
+
+async def _batch(graph, args):
+    with open(args.input, encoding="utf-8") as f:
+        total = sum(1 for line in f if line.strip())  # cheap pass, only for the ETA
+    progress = BatchProgress(total=total)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    last = time.monotonic()
+    try:
+        async for res in run_batch(read_jsonl(args.input), graph, args.workers, progress):
+            out.write(json.dumps(res, ensure_ascii=False, default=str) + "\n")
+            if time.monotonic() - last >= args.progress_every:
+                out.flush()
+                print(_progress_line(progress.snapshot()), file=sys.stderr)
+                last = time.monotonic()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(_progress_line(progress.snapshot()), file=sys.stderr)
 
+def _repl(graph, runner):
     print("SQL Agent CLI. Type 'exit' to quit, 'reset' to clear context.\n")
-    previous_turns = []
+    history = ConversationHistory()
 
     while True:
         try:
@@ -23,7 +84,7 @@ def main():
             print("Bye!")
             break
         if user_q.lower() == "reset":
-            previous_turns = []
+            history = ConversationHistory()
             print("(context cleared)")
             continue
 
@@ -31,9 +92,9 @@ def main():
             "user_query": user_q,
             "now_iso": now_iso_tz(settings.app_timezone),
             "timezone": settings.app_timezone,
-            "previous_turns": previous_turns,
+            "history": history,
         }
-        final = graph.invoke(state)
+        final = runner.run(_ask(graph, state))
 
         reply = final.get("reply_text") or "(no reply)"
         print(f"\nAssistant> {reply}\n")
@@ -46,7 +107,7 @@ def main():
             print(json.dumps(final["result_rows"][:10], indent=2, default=str))
             print(f"(rowcount={final.get('rowcount', 0)})\n")
 
-        previous_turns = final.get("previous_turns", previous_turns)
+        history = final.get("history", history)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+import pytest
+from agent.types import Column, SchemaSnapshot, Table
+from agent.utils.sql_check import check_sql, has_errors
+
+
+def _table(name, *cols):
+    return Table(
+        name=name,
+        columns=[Column(name=c, data_type="integer", nullable=True) for c in cols],
+        primary_key=[],
+        foreign_keys=[],
+    )
+
+
+SCHEMA = SchemaSnapshot(schema="retail", tables={"orders": _table("orders", "id", "total", "created_at")})
+
+
+@pytest.mark.parametrize("sql", [
+    "WITH t AS (SELECT id FROM orders) SELECT t.id FROM t",
+    "WITH t (n) AS (SELECT id FROM orders) SELECT n FROM t",
+    "WITH a AS (SELECT id FROM orders), b AS (SELECT id FROM a) SELECT * FROM b",
+    "WITH RECURSIVE r(n) AS (VALUES (1) UNION ALL SELECT n + 1 FROM r WHERE n < 3) SELECT n FROM r",
+])
+def test_cte(sql):
+    assert check_sql(sql, SCHEMA) == []
+
+
+@pytest.mark.parametrize("name", [
+    "data", "result", "summary", "month", "year", "day", "first", "last", "source", "final", "values",
+])
+def test_keyword_named_cte(name):
+    sql = f"WITH {name} AS (SELECT id, total FROM orders) SELECT {name}.total FROM {name} JOIN orders o ON o.id = {name}.id"
+    assert check_sql(sql, SCHEMA) == []
+
+
+def test_keyword_named_ctes_chained():
+    sql = (
+        "WITH data AS (SELECT id, total FROM orders), "
+        "result AS (SELECT sum(total) AS total FROM data) "
+        "SELECT * FROM result"
+    )
+    assert check_sql(sql, SCHEMA) == []
+
+
+@pytest.mark.parametrize("alias", ["final", "result", "data"])
+def test_keyword_alias(alias):
+    assert check_sql(f"SELECT {alias}.total FROM orders AS {alias}", SCHEMA) == []
+    diags = check_sql(f"SELECT {alias}.nope FROM orders AS {alias}", SCHEMA)
+    assert has_errors(diags) and "no column `nope`" in diags[0].message
+
+
+@pytest.mark.parametrize("mode", ["MATERIALIZED", "NOT MATERIALIZED", "materialized", "not materialized"])
+def test_materialized(mode):
+    sql = f"WITH m AS {mode} (SELECT id FROM orders) SELECT m.id FROM m"
+    assert check_sql(sql, SCHEMA) == []
+
+
+def test_unknown_table_still_reported():
+    diags = check_sql("WITH data AS (SELECT id FROM order_items) SELECT * FROM data", SCHEMA)
+    assert has_errors(diags)
+    assert "order_items" in diags[0].message
+
+
+def test_with_time_zone_is_not_a_cte():
+    assert check_sql("SELECT created_at::timestamp with time zone FROM orders", SCHEMA) == []